@@ -1,29 +1,37 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import logging
 import json
 import os
-from typing import Dict, List, Any, Optional
+from typing import TYPE_CHECKING, Dict, List, Any, Optional, Set, Tuple, Callable, Awaitable, Iterable, Iterator
 import asyncio
-import httpx
-import requests
 import string
-from itertools import product
+from bisect import bisect_left
+from itertools import islice, product
 import re
 import hashlib
-
-from faker import Faker
-
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import (
-    ApplicationBuilder,
-    CommandHandler,
-    MessageHandler,
-    CallbackQueryHandler,
-    ContextTypes,
-    filters,
-)
-from telegram.error import Conflict
+import secrets
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import dataclasses
+import contextlib
+import contextvars
+from dataclasses import dataclass, field
+import time
+import tempfile
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# httpx, faker and the telegram stack are imported where they are first needed so
+# that importing this module (test_server.py, test_mock.py, run_one.py) stays cheap.
+# Check with: python check_import_time.py
+if TYPE_CHECKING:
+    import httpx
+    from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+    from telegram.ext import ContextTypes
 
 
 # Enable logging
@@ -33,35 +41,1565 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Define the user data file
-USER_DATA_FILE = "user_data.json"
+# Runtime settings. Values the handlers consult on every update live in one
+# immutable Settings object that is parsed and validated once (see get_settings)
+# and swapped atomically by /reload_config. The module-level constants further
+# down size long-lived resources (HTTP pools, caches, the writer) and are only
+# read at import time, so changing those still requires a restart.
+ENV_FILE = os.environ.get("ENV_FILE", ".env")
+
+_TRUE_VALUES = ("1", "true", "yes", "on")
+_FALSE_VALUES = ("", "0", "false", "no", "off")
+
+
+def _env_bool(env: Dict[str, str], name: str, default: bool = False) -> bool:
+    raw = env.get(name)
+    if raw is None:
+        return default
+    value = raw.strip().lower()
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise ValueError(f"{name} must be a boolean (1/0, true/false, yes/no), got {raw!r}")
+
+
+def _env_int(env: Dict[str, str], name: str, default: int, minimum: int, maximum: Optional[int] = None) -> int:
+    raw = env.get(name, "").strip()
+    if not raw:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {raw!r}") from None
+    if value < minimum or (maximum is not None and value > maximum):
+        bounds = f">= {minimum}" if maximum is None else f"between {minimum} and {maximum}"
+        raise ValueError(f"{name} must be {bounds}, got {value}")
+    return value
+
+
+def _env_url(env: Dict[str, str], name: str) -> Optional[str]:
+    raw = env.get(name, "").strip()
+    if not raw:
+        return None
+    if not raw.startswith(("http://", "https://")):
+        raise ValueError(f"{name} must be an http(s) URL, got {raw!r}")
+    return raw
+
+
+def _env_ids(env: Dict[str, str], name: str) -> frozenset:
+    ids = set()
+    for part in env.get(name, "").replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            ids.add(int(part))
+        except ValueError:
+            raise ValueError(f"{name} must be a comma-separated list of Telegram user ids, got {part!r}") from None
+    return frozenset(ids)
+
+
+FORESTAPI_PUBLIC_URL = "https://forestapi.vercel.app"
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """Typed, validated view of the environment variables the handlers use."""
+
+    mock_mode: bool = False
+    tiktok_mock_count: int = 5
+    tiktok_api_url: Optional[str] = None
+    tiktok_api_key: Optional[str] = None
+    instagram_api_url: Optional[str] = None
+    instagram_api_key: Optional[str] = None
+    # Base URL the forestapi lookups are sent to; point it at fake_upstream.py to work offline
+    forestapi_base_url: str = FORESTAPI_PUBLIC_URL
+    probe_max_len: int = 2
+    probe_concurrency: int = 5
+    probe_candidate_limit: int = 200
+    # Telegram user ids allowed to run admin commands such as /reload_config
+    admin_ids: frozenset = frozenset()
+    # Log the span tree of updates slower than this; 0 disables tracing
+    trace_slow_ms: int = 0
+
+    @classmethod
+    def from_env(cls, env: Optional[Dict[str, str]] = None) -> "Settings":
+        """Build settings from `env` (default: os.environ). Raises ValueError on invalid values."""
+        env = os.environ if env is None else env
+        return cls(
+            mock_mode=_env_bool(env, "MOCK_MODE"),
+            tiktok_mock_count=_env_int(env, "TIKTOK_MOCK_COUNT", 5, minimum=1, maximum=50),
+            tiktok_api_url=_env_url(env, "TIKTOK_API_URL"),
+            tiktok_api_key=env.get("TIKTOK_API_KEY") or None,
+            instagram_api_url=_env_url(env, "INSTAGRAM_API_URL"),
+            instagram_api_key=env.get("INSTAGRAM_API_KEY") or None,
+            forestapi_base_url=(_env_url(env, "FORESTAPI_BASE_URL") or FORESTAPI_PUBLIC_URL).rstrip("/"),
+            probe_max_len=_env_int(env, "PROBE_MAX_LEN", 2, minimum=1),
+            probe_concurrency=_env_int(env, "PROBE_CONCURRENCY", 5, minimum=1),
+            probe_candidate_limit=_env_int(env, "PROBE_CANDIDATE_LIMIT", 200, minimum=1),
+            admin_ids=_env_ids(env, "ADMIN_IDS"),
+            trace_slow_ms=_env_int(env, "TRACE_SLOW_MS", 0, minimum=0),
+        )
 
 
-def load_user_data() -> Dict:
-    """Load user data from JSON file."""
+def read_env_file(path: str = ENV_FILE) -> Dict[str, str]:
+    """Parse a simple KEY=VALUE .env file (same format run.sh accepts). Missing file -> {}."""
+    values: Dict[str, str] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                name, value = line.split("=", 1)
+                name = name.strip()
+                if name.startswith("export "):
+                    name = name[len("export "):].strip()
+                values[name] = value.strip().strip("'\"")
+    except FileNotFoundError:
+        pass
+    return values
+
+
+_settings: Optional[Settings] = None
+
+
+def get_settings() -> Settings:
+    """Return the current settings, parsing the environment on first use.
+
+    Loading is deferred so that scripts which set os.environ after importing this
+    module (test_mock.py, test_search_local.py) still see their values.
+    """
+    global _settings
+    if _settings is None:
+        _settings = Settings.from_env()
+    return _settings
+
+
+def reload_settings(env_file: Optional[str] = ENV_FILE) -> Settings:
+    """Re-read `env_file` into os.environ and rebuild the settings.
+
+    Validation happens before anything is replaced: on ValueError both os.environ
+    and the active settings are left untouched.
+    """
+    global _settings
+    overrides = read_env_file(env_file) if env_file else {}
+    settings = Settings.from_env({**os.environ, **overrides})
+    os.environ.update(overrides)
+    _settings = settings
+    return settings
+
+
+def _settings_for(context) -> Settings:
+    """Settings as seen by a handler: the copy in bot_data, or the module-level one."""
+    bot_data = getattr(context, "bot_data", None)
+    if isinstance(bot_data, dict):
+        settings = bot_data.get("settings")
+        if isinstance(settings, Settings):
+            return settings
+    return get_settings()
+
+
+# Metrics. Counters and latency histograms are kept in process and served in the
+# Prometheus text format on http://METRICS_HOST:METRICS_PORT/metrics (off when the
+# port is 0). Recording one sample is a dict lookup plus a bisect, so it stays on in
+# production. Samples are only recorded from the event loop thread.
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+# Seconds; spans cache hits (well under 1 ms) up to slow scrapes and flood-control waits
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    parts = [
+        f'{n}="' + str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+        for n, v in zip(names, values)
+    ]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricCounter:
+    """Monotonic counter, one value per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[Any, ...], float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: Any) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class MetricHistogram:
+    """Fixed-bucket histogram; buckets are made cumulative only when rendered."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[Tuple[Any, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels: Any) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> Iterator[str]:
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            suffix = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{suffix} {_format_value(series[-1])}"
+            yield f"{self.name}_count{suffix} {cumulative}"
+
+
+class MetricGauge:
+    """Value read from `func` at scrape time, so nothing is recorded on the hot path."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+
+    def samples(self) -> Iterator[str]:
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.debug("Gauge %s failed: %s", self.name, e)
+            return
+        yield f"{self.name} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> MetricCounter:
+        return self._register(MetricCounter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> MetricHistogram:
+        return self._register(MetricHistogram(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, func: Callable[[], float]) -> MetricGauge:
+        return self._register(MetricGauge(name, documentation, func))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+handler_calls = metrics.counter(
+    "krisbot_handler_calls_total", "Handler invocations by handler and outcome (ok or error).", ("handler", "outcome"))
+handler_seconds = metrics.histogram(
+    "krisbot_handler_duration_seconds", "Time spent in each handler.", ("handler",))
+http_responses = metrics.counter(
+    "krisbot_http_responses_total", "Outbound HTTP responses by host and status code.", ("host", "status"))
+http_seconds = metrics.histogram(
+    "krisbot_http_response_seconds", "Time from sending an outbound HTTP request to its response headers.", ("host",))
+user_data_saves = metrics.counter(
+    "krisbot_user_data_saves_total", "user_data persistence batches by result (ok or error).", ("result",))
+user_data_save_seconds = metrics.histogram(
+    "krisbot_user_data_save_seconds", "Time to serialize and write one user_data persistence batch.")
+user_data_bytes_written = metrics.counter(
+    "krisbot_user_data_bytes_written_total", "Bytes written to the user_data journal and snapshot.")
+
+
+def _instrumented(label: str, callback):
+    """Wrap a handler callback so each call is counted and timed under `label`."""
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with trace_span("handler", handler=label):
+                result = await callback(update, context)
+            outcome = "ok"
+            return result
+        finally:
+            handler_calls.inc(label, outcome)
+            handler_seconds.observe(time.perf_counter() - started, label)
+
+    return wrapper
+
+
+def _handler_label(handler) -> str:
+    commands = getattr(handler, "commands", None)
+    if commands:
+        return "/" + sorted(commands)[0]
+    return getattr(handler.callback, "__name__", type(handler).__name__)
+
+
+async def _on_http_request(request) -> None:
+    request.extensions["krisbot_started"] = time.perf_counter()
+    parent = _current_span.get()
+    if parent is not None:
+        # A leaf span, finished by the response hook; it never becomes the current span
+        span = parent.child("http", {"method": request.method, "host": request.url.host, "path": request.url.path})
+        if span is not None:
+            request.extensions["krisbot_span"] = span
+
+
+async def _on_http_response(response) -> None:
+    # Runs when the headers arrive, before a streamed body is read
+    request = response.request
+    host = host_label(request.url.host)
+    http_responses.inc(host, response.status_code)
+    # Popped so that _on_http_error skips failures after the headers (reading the body)
+    started = request.extensions.pop("krisbot_started", None)
+    if started is not None:
+        http_seconds.observe(time.perf_counter() - started, host)
+    span = request.extensions.get("krisbot_span")
+    if span is not None:
+        span.attrs["status"] = response.status_code
+        span.finish()
+
+
+def _on_http_error(request, exc: BaseException) -> None:
+    """Record a request that ended without a response (timeout, connection error, cancel).
+
+    httpx only runs response hooks for responses, so InstrumentedAsyncClient calls this.
+    Redirects share the extensions dict, so this sees the last request that was sent.
+    """
+    if request.extensions.pop("krisbot_started", None) is None:
+        return
+    http_responses.inc(host_label(request.url.host), "error")
+    span = request.extensions.get("krisbot_span")
+    if span is not None:
+        span.attrs["status"] = "error"
+        span.attrs["error"] = type(exc).__name__
+        span.finish()
+
+
+def _record_user_data_save(started: float, written: Optional[int]) -> None:
+    """Record one persistence batch; `written` is None when it failed."""
+    user_data_save_seconds.observe(time.perf_counter() - started)
+    if written is None:
+        user_data_saves.inc("error")
+    else:
+        user_data_saves.inc("ok")
+        user_data_bytes_written.inc(amount=written)
+
+
+class MetricsServer:
+    """Minimal HTTP/1.0 server answering GET /metrics, so polling mode needs no web framework."""
+
+    def __init__(self, registry: MetricsRegistry, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info("Serving metrics on http://%s:%d/metrics", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # Headers are not needed, but must be read before answering
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", self.registry.render().encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status, body, content_type = "404 Not Found", b"not found\n", "text/plain"
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode("ascii") + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+_metrics_server: Optional[MetricsServer] = None
+
+
+# Tracing. With TRACE_SLOW_MS set, every update gets a trace ID and a tree of timed
+# spans (dispatch, handler, outbound HTTP, user_data persistence, Bot API calls).
+# Updates slower than the threshold are logged as one structured record. The
+# current span travels in a context variable, so tasks started while handling an
+# update inherit it; with tracing off trace_span() is one ContextVar lookup.
+TRACE_MAX_SPANS = max(1, int(os.environ.get("TRACE_MAX_SPANS", "500")))
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("krisbot_span", default=None)
+_NO_SPAN = contextlib.nullcontext()
+
+
+class Trace:
+    __slots__ = ("trace_id", "root", "spans", "dropped", "closed")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.trace_id = secrets.token_hex(8)
+        self.spans = 1
+        self.dropped = 0
+        self.closed = False
+        self.root = Span(self, name, attrs)
+
+
+class Span:
+    __slots__ = ("trace", "name", "attrs", "started", "ended", "children")
+
+    def __init__(self, trace: Trace, name: str, attrs: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.ended: Optional[float] = None
+        self.children: List[Span] = []
+
+    def child(self, name: str, attrs: Dict[str, Any]) -> Optional["Span"]:
+        """Start a child span, or return None once the trace is finished or full."""
+        trace = self.trace
+        if trace.closed:
+            return None
+        if trace.spans >= TRACE_MAX_SPANS:
+            trace.dropped += 1
+            return None
+        trace.spans += 1
+        span = Span(trace, name, attrs)
+        self.children.append(span)
+        return span
+
+    def finish(self) -> None:
+        self.ended = time.perf_counter()
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        # A span still open when the trace is logged (e.g. a request left running) has ms None
+        node: Dict[str, Any] = {
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1000, 2),
+            "ms": None if self.ended is None else round((self.ended - self.started) * 1000, 2),
+        }
+        if self.attrs:
+            node["attrs"] = self.attrs
+        if self.children:
+            node["children"] = [c.to_dict(origin) for c in self.children]
+        return node
+
+
+class _SpanScope:
+    """Makes `span` the current span for the body of a with-block."""
+
+    __slots__ = ("span", "token")
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.span.finish()
+        if exc_type is not None:
+            self.span.attrs["error"] = exc_type.__name__
+        _current_span.reset(self.token)
+
+
+def trace_span(name: str, **attrs: Any):
+    """Context manager timing a nested span of the current trace; a no-op outside one."""
+    parent = _current_span.get()
+    if parent is None:
+        return _NO_SPAN
+    span = parent.child(name, attrs)
+    return _NO_SPAN if span is None else _SpanScope(span)
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return None if span is None else span.trace.trace_id
+
+
+async def run_traced(name: str, attrs: Dict[str, Any], awaitable: Awaitable[Any], slow_ms: int) -> None:
+    """Await `awaitable` as the root span of a new trace; log the tree if it took >= slow_ms."""
+    trace = Trace(name, attrs)
+    try:
+        with _SpanScope(trace.root):
+            await awaitable
+    finally:
+        trace.closed = True
+        elapsed_ms = (trace.root.ended - trace.root.started) * 1000
+        if elapsed_ms >= slow_ms:
+            record = {"trace_id": trace.trace_id, "ms": round(elapsed_ms, 2), "threshold_ms": slow_ms,
+                      "dropped_spans": trace.dropped, "root": trace.root.to_dict(trace.root.started)}
+            logger.warning("Slow update trace %s", json.dumps(record, default=str, separators=(",", ":")),
+                           extra={"trace": record})
+
+
+# Define the user data file. USER_DATA_FILE is the compacted snapshot; every
+# change made since the last compaction is appended to USER_DATA_JOURNAL as a
+# single JSON line holding the full record of the user that changed.
+# Both paths can be overridden, e.g. by supervisor.py to give each worker its own shard.
+USER_DATA_FILE = os.environ.get("USER_DATA_FILE", "user_data.json")
+USER_DATA_JOURNAL = os.environ.get("USER_DATA_JOURNAL", "user_data.journal")
+
+# Number of journal entries after which the journal is folded back into the snapshot
+USER_DATA_COMPACT_EVERY = max(1, int(os.environ.get("USER_DATA_COMPACT_EVERY", "1000")))
+
+_journal_entries = 0
+
+
+@dataclass(slots=True)
+class UserRecord:
+    """Per-user state with a fixed schema.
+
+    The hot session fields are plain slots. The heavier `fetched_data` section
+    is serialized as embedded JSON text and only decoded the first time it is
+    accessed, so records that are loaded and saved again without being touched
+    never pay for decoding or re-encoding it. Scrape history is not part of the
+    record; it lives in `scrape_history`.
+    """
+
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    social_media: List[str] = field(default_factory=list)
+    tokens: Dict[str, str] = field(default_factory=dict)
+    awaiting_token: bool = False
+    awaiting_platform: Optional[str] = None
+    is_adding_platform: bool = False
+    # dict once decoded, str while still in serialized form, None when empty
+    _fetched_data: Any = None
+
+    @staticmethod
+    def _decode(value: Any) -> Dict[str, Any]:
+        if isinstance(value, str):
+            return json.loads(value)
+        return value if value is not None else {}
+
+    @property
+    def fetched_data(self) -> Dict[str, Any]:
+        if not isinstance(self._fetched_data, dict):
+            self._fetched_data = self._decode(self._fetched_data)
+        return self._fetched_data
+
+    @property
+    def onboarded(self) -> bool:
+        return bool(self.email and self.phone)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UserRecord":
+        """Build a record from its stored form, including the older free-form dicts."""
+        tokens = dict(data.get("tokens") or {})
+        for name, value in data.items():
+            # Older records stored tokens as "<platform>_token" keys
+            if name.endswith("_token") and isinstance(value, str) and value:
+                tokens.setdefault(name[: -len("_token")], value)
+        return cls(
+            email=data.get("email"),
+            phone=data.get("phone"),
+            social_media=list(data.get("social_media") or []),
+            tokens=tokens,
+            awaiting_token=bool(data.get("awaiting_token")),
+            awaiting_platform=data.get("awaiting_platform") or None,
+            is_adding_platform=bool(data.get("is_adding_platform")),
+            _fetched_data=data.get("fetched_data") or None,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact stored form: defaults are omitted and heavy sections stay JSON text."""
+        data: Dict[str, Any] = {}
+        if self.email is not None:
+            data["email"] = self.email
+        if self.phone is not None:
+            data["phone"] = self.phone
+        if self.social_media:
+            data["social_media"] = self.social_media
+        if self.tokens:
+            data["tokens"] = self.tokens
+        if self.awaiting_token:
+            data["awaiting_token"] = True
+        if self.awaiting_platform:
+            data["awaiting_platform"] = self.awaiting_platform
+        if self.is_adding_platform:
+            data["is_adding_platform"] = True
+        if isinstance(self._fetched_data, str):
+            data["fetched_data"] = self._fetched_data
+        elif self._fetched_data:
+            data["fetched_data"] = json.dumps(self._fetched_data, separators=(",", ":"))
+        return data
+
+
+# Scrape history (TikTok searches, scraped links, probed candidates) is kept out
+# of the hot user records in its own SQLite database and read only on demand.
+SCRAPE_HISTORY_DB = os.environ.get("SCRAPE_HISTORY_DB", "scrape_history.db")
+# Entries kept per user and kind; older ones are deleted on insert
+SCRAPE_HISTORY_RETENTION = max(1, int(os.environ.get("SCRAPE_HISTORY_RETENTION", "50")))
+
+
+class ScrapeHistoryStore:
+    """Per-user scrape results in SQLite with a per-(user, kind) retention limit.
+
+    `kind` is e.g. "tiktok", "tiktok_links" or "tiktok_candidates" and `item`
+    the URL / pattern / query the results belong to; re-scraping the same item
+    replaces its previous entry. All database access runs on one dedicated
+    worker thread so the event loop never blocks on disk.
+    """
+
+    def __init__(self, path: str = SCRAPE_HISTORY_DB, retention: int = SCRAPE_HISTORY_RETENTION):
+        self.path = path
+        self.retention = retention
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scrape_history ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, uid TEXT NOT NULL, kind TEXT NOT NULL, "
+                "item TEXT NOT NULL, result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS scrape_history_uid_kind ON scrape_history (uid, kind, id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, uid TEXT NOT NULL, kind TEXT NOT NULL, item TEXT NOT NULL, "
+                "status TEXT NOT NULL, result TEXT NOT NULL, created_at REAL NOT NULL, finished_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_uid_created ON jobs (uid, created_at)")
+            self._conn = conn
+        return self._conn
+
+    def _insert(self, rows: List[tuple]) -> None:
+        conn = self._connection()
+        with conn:
+            for uid, kind, item, result_json, created_at in rows:
+                conn.execute("DELETE FROM scrape_history WHERE uid = ? AND kind = ? AND item = ?", (uid, kind, item))
+                conn.execute(
+                    "INSERT INTO scrape_history (uid, kind, item, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (uid, kind, item, result_json, created_at),
+                )
+            for uid, kind in {(row[0], row[1]) for row in rows}:
+                conn.execute(
+                    "DELETE FROM scrape_history WHERE uid = ? AND kind = ? AND id NOT IN "
+                    "(SELECT id FROM scrape_history WHERE uid = ? AND kind = ? ORDER BY id DESC LIMIT ?)",
+                    (uid, kind, uid, kind, self.retention),
+                )
+
+    def _select(self, uid: str, kind: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        conn = self._connection()
+        if kind is None:
+            cur = conn.execute(
+                "SELECT kind, item, result, created_at FROM scrape_history WHERE uid = ? ORDER BY id DESC LIMIT ?",
+                (uid, limit),
+            )
+        else:
+            cur = conn.execute(
+                "SELECT kind, item, result, created_at FROM scrape_history WHERE uid = ? AND kind = ? ORDER BY id DESC LIMIT ?",
+                (uid, kind, limit),
+            )
+        return [
+            {"kind": k, "item": item, "result": json.loads(result), "created_at": created_at}
+            for k, item, result, created_at in cur.fetchall()
+        ]
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scrape-history")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def record(self, uid: str, kind: str, item: str, result: Any) -> None:
+        row = (uid, kind, item, json.dumps(result, separators=(",", ":")), time.time())
+        try:
+            await self._run(self._insert, [row])
+        except Exception as e:
+            logger.error(f"Error saving scrape history: {e}")
+
+    async def history(self, uid: str, kind: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        return await self._run(self._select, uid, kind, limit)
+
+    def _upsert_job(self, row: tuple) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, uid, kind, item, status, result, created_at, finished_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE uid = ? AND id NOT IN "
+                "(SELECT id FROM jobs WHERE uid = ? ORDER BY created_at DESC LIMIT ?)",
+                (row[1], row[1], self.retention),
+            )
+
+    def _select_job(self, uid: str, job_id: str) -> Optional[Dict[str, Any]]:
+        cur = self._connection().execute(
+            "SELECT id, kind, item, status, result, created_at, finished_at FROM jobs WHERE uid = ? AND id = ?",
+            (uid, job_id),
+        )
+        row = cur.fetchone()
+        if row is None:
+            return None
+        keys = ("id", "kind", "item", "status", "result", "created_at", "finished_at")
+        return dict(zip(keys, row))
+
+    def _interrupt_jobs(self) -> int:
+        conn = self._connection()
+        with conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'interrupted', finished_at = ? WHERE status IN ('queued', 'running')",
+                (time.time(),),
+            )
+        return cur.rowcount
+
+    async def save_job(self, job: Job) -> None:
+        row = (job.id, job.uid, job.kind, job.item, job.status, job.result, job.created_at, job.finished_at)
+        try:
+            await self._run(self._upsert_job, row)
+        except Exception as e:
+            logger.error(f"Error saving job {job.id}: {e}")
+
+    async def job(self, uid: str, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._select_job, uid, job_id)
+
+    async def interrupt_unfinished_jobs(self) -> int:
+        """Mark jobs left queued/running by a previous process as interrupted."""
+        return await self._run(self._interrupt_jobs)
+
+    def copy_from(self, src_path: str, keep: Callable[[str], bool]) -> int:
+        """Synchronously copy history and job rows of the uids accepted by `keep` from
+        another database (used by supervisor.py when rebalancing shards)."""
+        conn = self._connection()
+        conn.create_function("keep_uid", 1, keep, deterministic=True)
+        conn.execute("ATTACH DATABASE ? AS src", (src_path,))
+        try:
+            tables = {row[0] for row in conn.execute("SELECT name FROM src.sqlite_master WHERE type = 'table'")}
+            copied = 0
+            with conn:
+                if "scrape_history" in tables:
+                    copied = conn.execute(
+                        "INSERT INTO scrape_history (uid, kind, item, result, created_at) "
+                        "SELECT uid, kind, item, result, created_at FROM src.scrape_history WHERE keep_uid(uid) ORDER BY id"
+                    ).rowcount
+                if "jobs" in tables:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO jobs (id, uid, kind, item, status, result, created_at, finished_at) "
+                        "SELECT id, uid, kind, item, status, result, created_at, finished_at FROM src.jobs WHERE keep_uid(uid)"
+                    )
+        finally:
+            conn.execute("DETACH DATABASE src")
+        return copied
+
+    def import_platform_data(self, uid: str, platform_data: Dict[str, Any]) -> None:
+        """Synchronously move a legacy `platform_data` section into the store."""
+        now = time.time()
+        rows = []
+        for kind, value in platform_data.items():
+            if isinstance(value, dict):
+                # "<platform>_links" / "tiktok_candidates": {url_or_pattern: results}
+                rows.extend((uid, kind, item, json.dumps(res, separators=(",", ":")), now) for item, res in value.items())
+            else:
+                rows.append((uid, kind, "", json.dumps(value, separators=(",", ":")), now))
+        if rows:
+            self._insert(rows)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+scrape_history = ScrapeHistoryStore()
+
+
+# Long-running scrapes run as background jobs: the handler replies with a job id
+# straight away and a worker edits that reply with progress and the final result.
+JOB_WORKERS = max(1, int(os.environ.get("JOB_WORKERS", "4")))
+JOB_MAX_PENDING = max(1, int(os.environ.get("JOB_MAX_PENDING", "100")))
+# Queued plus running jobs one user may have; below JOB_WORKERS so nobody holds every worker
+JOB_MAX_PER_USER = max(1, int(os.environ.get("JOB_MAX_PER_USER", "3")))
+# Seconds shutdown waits for results that are already being delivered
+JOB_STOP_TIMEOUT = float(os.environ.get("JOB_STOP_TIMEOUT", "10"))
+# Minimum seconds between progress edits of one job's message
+JOB_PROGRESS_INTERVAL = float(os.environ.get("JOB_PROGRESS_INTERVAL", "2.0"))
+
+JOB_FINISHED = ("done", "failed", "cancelled", "interrupted")
+
+
+@dataclass(slots=True)
+class Job:
+    id: str
+    uid: str
+    kind: str
+    item: str
+    description: str
+    status: str = "queued"  # queued | running | done | failed | cancelled | interrupted
+    progress: str = ""
+    result: str = ""
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    # Not persisted: the status message to edit, a reply fallback and the running task
+    message: Any = None
+    reply: Optional[Callable[[str], Awaitable[Any]]] = None
+    task: Optional[asyncio.Task] = None
+    # Trace of the update that submitted the job, when tracing is on
+    trace_id: Optional[str] = None
+
+    def report(self, progress: str) -> None:
+        """Set the progress line; the manager pushes it to the chat on its next tick."""
+        self.progress = progress
+
+    def status_text(self) -> str:
+        lines = [self.description]
+        if self.progress:
+            lines.append(self.progress)
+        lines.append(f"Job {self.id} — send /cancel {self.id} to stop it.")
+        return "\n".join(lines)
+
+
+JobFunc = Callable[[Job], Awaitable[str]]
+
+
+class JobManager:
+    """Queue of background jobs served by a fixed pool of worker tasks.
+
+    Jobs and their final message are persisted through `store` (the scrape history
+    database) so /job can report on them after they left memory. Without started
+    workers (test harnesses driving handlers directly) submit() runs the job inline.
+    """
+
+    def __init__(self, store: ScrapeHistoryStore, workers: int = JOB_WORKERS,
+                 max_pending: int = JOB_MAX_PENDING, progress_interval: float = JOB_PROGRESS_INTERVAL,
+                 max_per_user: int = JOB_MAX_PER_USER, stop_timeout: float = JOB_STOP_TIMEOUT):
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_per_user = max_per_user
+        self.progress_interval = progress_interval
+        self.stop_timeout = stop_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # Jobs stay here until their result is saved and shown, so stop() can tell
+        # delivered jobs from interrupted ones
+        self._jobs: Dict[str, Job] = {}
+        # Results being saved and shown; stop() lets these complete
+        self._finishing: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    async def start(self) -> None:
+        interrupted = await self.store.interrupt_unfinished_jobs()
+        if interrupted:
+            logger.info("Marked %d unfinished job(s) from a previous run as interrupted", interrupted)
+        # Unbounded: submit() caps queued jobs at max_pending; cancelled jobs stay in the
+        # queue until a worker skips them and must not count against that limit
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stop the workers and mark every job whose result was not delivered as interrupted.
+
+        Results already being saved and shown get up to `stop_timeout` seconds to finish.
+        """
+        if self._finishing:
+            await asyncio.wait(set(self._finishing), timeout=self.stop_timeout)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for task in list(self._finishing):
+            task.cancel()
+        await asyncio.gather(*self._finishing, return_exceptions=True)
+        for job in list(self._jobs.values()):
+            if job.task is not None:
+                job.task.cancel()
+            job.status = "interrupted"
+            job.finished_at = time.time()
+            await self.store.save_job(job)
+        self._jobs.clear()
+
+    async def drain(self) -> None:
+        """Wait until every submitted job has run and its result was saved and shown."""
+        if self._queue is not None:
+            await self._queue.join()
+        # Jobs cancelled while queued are finished by the /cancel handler, not a worker
+        while self._finishing:
+            await asyncio.wait(set(self._finishing))
+
+    def pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == "queued")
+
+    def active_jobs(self, uid: str) -> List[Job]:
+        # Finished jobs whose result is still being delivered are not active
+        return [job for job in self._jobs.values() if job.uid == uid and job.status not in JOB_FINISHED]
+
+    async def submit(self, update, uid: str, kind: str, item: str, description: str, func: JobFunc) -> Optional[Job]:
+        """Start `func` as a job for the user behind `update`.
+
+        Returns None when the queue is full or the user already has `max_per_user` jobs.
+        """
+        if self.running and self.pending() >= self.max_pending:
+            await update.message.reply_text("The bot is busy right now, please try again in a minute.")
+            return None
+        if self.running and len(self.active_jobs(uid)) >= self.max_per_user:
+            await update.message.reply_text(
+                f"You already have {self.max_per_user} jobs queued or running. "
+                "Wait for one to finish or stop one with /cancel.")
+            return None
+        job = Job(id=secrets.token_hex(4), uid=uid, kind=kind, item=item, description=description)
+        job.reply = update.message.reply_text
+        job.trace_id = current_trace_id()
+        # Registered before the first await so concurrent submits count it in pending()
+        self._jobs[job.id] = job
+        try:
+            sent = await job.reply(job.status_text())
+            job.message = sent if hasattr(sent, "edit_text") else None
+            await self.store.save_job(job)
+        except BaseException:
+            self._jobs.pop(job.id, None)
+            raise
+        if self.running:
+            self._queue.put_nowait((job, func))
+        else:
+            await self._execute(job, func)
+        return job
+
+    async def cancel(self, uid: str, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.uid != uid or job.status in JOB_FINISHED:
+            return False
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # still queued: the worker skips it when it comes up
+            await self._finish(job, "cancelled", "Job cancelled.")
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            job, func = await self._queue.get()
+            try:
+                if job.status == "queued":
+                    slow_ms = get_settings().trace_slow_ms
+                    if slow_ms:
+                        # Worker tasks run outside any update, so each job is its own trace
+                        attrs = {"job_id": job.id, "kind": job.kind, "update_trace_id": job.trace_id}
+                        await run_traced("job", attrs, self._execute(job, func), slow_ms)
+                    else:
+                        await self._execute(job, func)
+            except Exception:
+                logger.exception("Job worker failed on job %s", job.id)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: Job, func: JobFunc) -> None:
+        job.status = "running"
+        await self.store.save_job(job)
+        if job.status != "running":
+            return  # cancelled while the row was being written
+        job.task = asyncio.create_task(func(job))
+        ticker = asyncio.create_task(self._progress_loop(job)) if job.message is not None else None
+        try:
+            await asyncio.wait({job.task})
+        finally:
+            if ticker is not None:
+                ticker.cancel()
+        if job.task.cancelled():
+            await self._finish(job, "cancelled", "Job cancelled.")
+        elif job.task.exception() is not None:
+            e = job.task.exception()
+            logger.error("Job %s (%s) failed", job.id, job.kind, exc_info=e)
+            await self._finish(job, "failed", f"An error occurred while scraping: {e}")
+        else:
+            await self._finish(job, "done", job.task.result())
+
+    async def _progress_loop(self, job: Job) -> None:
+        shown = job.progress
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            if job.progress != shown:
+                shown = job.progress
+                await self._show(job, job.status_text())
+
+    async def _finish(self, job: Job, status: str, result: str) -> None:
+        job.status = status
+        job.result = result
+        job.finished_at = time.time()
+        job.task = None
+        # Shielded: cancelling the worker (shutdown) must not cut the delivery short;
+        # stop() waits for self._finishing instead
+        task = asyncio.create_task(self._deliver(job))
+        self._finishing.add(task)
+        task.add_done_callback(self._finishing.discard)
+        await asyncio.shield(task)
+
+    async def _deliver(self, job: Job) -> None:
+        try:
+            await self.store.save_job(job)
+        except Exception:
+            logger.exception("Could not save the result of job %s", job.id)
+        await self._show(job, job.result)
+        # Not reached when cancelled, so stop() still marks the job interrupted
+        self._jobs.pop(job.id, None)
+
+    async def _show(self, job: Job, text: str) -> None:
+        """Edit the job's status message in place, or reply when there is none to edit."""
+        try:
+            if job.message is not None:
+                await job.message.edit_text(text)
+            elif job.reply is not None and job.status in JOB_FINISHED:
+                await job.reply(text)
+        except Exception as e:
+            # e.g. "message is not modified" or the chat was deleted
+            logger.debug("Could not update message for job %s: %s", job.id, e)
+
+
+job_manager = JobManager(scrape_history)
+metrics.gauge("krisbot_jobs_active", "Background scrape jobs queued or running.", lambda: len(job_manager))
+
+
+def _split_legacy_platform_data(key: str, raw: Dict[str, Any], legacy: Dict[str, Any]) -> Dict[str, Any]:
+    """Remove a legacy `platform_data` section from a stored record, collecting it into `legacy`."""
+    platform_data = raw.pop("platform_data", None)
+    if isinstance(platform_data, str):
+        platform_data = json.loads(platform_data)
+    if platform_data:
+        legacy.setdefault(key, {}).update(platform_data)
+    return raw
+
+
+def _record_to_json(record: Any) -> Any:
+    return record.to_dict() if isinstance(record, UserRecord) else record
+
+
+def _read_journal(path: str) -> Tuple[List[Dict[str, Any]], bool, int]:
+    """Parse the journal at `path`.
+
+    Returns (entries, damaged, intact_size). `damaged` is set when a line is malformed
+    or the last line has no newline (an append torn by a crash); the journal must then
+    be repaired before anything else is appended, or the next record would be glued
+    onto the torn line and lost with it. `intact_size` is the byte length up to the
+    last newline-terminated line.
+    """
+    entries: List[Dict[str, Any]] = []
+    damaged = False
+    intact_size = 0
+    if not os.path.exists(path):
+        return entries, damaged, intact_size
+    with open(path, "rb") as f:
+        for lineno, raw in enumerate(f, start=1):
+            if raw.endswith(b"\n"):
+                intact_size += len(raw)
+            else:
+                damaged = True
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                # Typically the torn final line from a crash mid-write; the lines before it are intact
+                logger.warning(f"Skipping malformed user data journal entry at line {lineno}")
+                damaged = True
+    return entries, damaged, intact_size
+
+
+def _replay_journal(data: Dict, legacy: Dict[str, Any]) -> Tuple[int, bool, int]:
+    """Apply journal entries on top of a loaded snapshot.
+
+    Returns (entries applied, damaged, intact_size) as described in _read_journal.
+    """
+    entries, damaged, intact_size = _read_journal(USER_DATA_JOURNAL)
+    for entry in entries:
+        if entry.get("v") is None:
+            data.pop(entry["k"], None)
+        else:
+            data[entry["k"]] = UserRecord.from_dict(_split_legacy_platform_data(entry["k"], entry["v"], legacy))
+    return len(entries), damaged, intact_size
+
+
+def load_user_data() -> Dict[str, UserRecord]:
+    """Load user data from the JSON snapshot and replay the journal on top of it.
+
+    An existing plain `user_data.json` from older versions is read as the snapshot,
+    so no explicit migration step is needed: the journal is created on first write.
+    Scrape history still embedded in old records (`platform_data`) is moved into
+    `scrape_history` and the snapshot is compacted without it. A journal damaged by
+    a crash is compacted away here, before the first new append.
+    """
+    global _journal_entries
+    data: Dict[str, UserRecord] = {}
+    legacy: Dict[str, Any] = {}
+    damaged, intact_size = False, 0
     try:
         if os.path.exists(USER_DATA_FILE):
             with open(USER_DATA_FILE, "r") as f:
-                return json.load(f)
+                data = {k: UserRecord.from_dict(_split_legacy_platform_data(k, v, legacy)) for k, v in json.load(f).items()}
     except json.JSONDecodeError:
         logger.error("Error decoding JSON from user data file")
-    return {}
+    try:
+        _journal_entries, damaged, intact_size = _replay_journal(data, legacy)
+    except Exception as e:
+        logger.error(f"Error replaying user data journal: {e}")
+    compacted = False
+    if legacy:
+        try:
+            for key, platform_data in legacy.items():
+                scrape_history.import_platform_data(key, platform_data)
+            compact_user_data(data)
+            compacted = True
+            logger.info(f"Moved scrape history of {len(legacy)} user(s) into {scrape_history.path}")
+        except Exception as e:
+            # The old sections stay in the snapshot on disk until a later migration succeeds
+            logger.error(f"Error migrating scrape history: {e}")
+    if damaged and not compacted:
+        try:
+            if legacy:
+                # The snapshot must keep the unmigrated sections, so only cut the torn tail off
+                os.truncate(USER_DATA_JOURNAL, intact_size)
+            else:
+                compact_user_data(data)
+            logger.warning("Repaired a damaged user data journal left by an interrupted write")
+        except Exception as e:
+            logger.error(f"Error repairing user data journal: {e}")
+    return data
+
+
+def _journal_line(data: Dict, key: str) -> str:
+    record = data.get(key)
+    return json.dumps({"k": key, "v": None if record is None else _record_to_json(record)}, separators=(",", ":"))
+
+
+def _serialize_snapshot(data: Dict) -> str:
+    return json.dumps({k: _record_to_json(v) for k, v in data.items()}, separators=(",", ":"))
+
+
+def _write_snapshot(serialized: str) -> int:
+    """Atomically replace the snapshot with `serialized`, truncate the journal and return the bytes written."""
+    global _journal_entries
+    tmp_path = USER_DATA_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        # json.dumps escapes non-ASCII, so characters written == bytes written
+        written = f.write(serialized)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, USER_DATA_FILE)
+    # The snapshot now contains every journalled change, so the journal can go
+    with open(USER_DATA_JOURNAL, "w"):
+        pass
+    _journal_entries = 0
+    return written
+
+
+def _append_journal(lines: List[str], snapshot: Optional[str] = None) -> int:
+    """Append journal lines in a single write, then compact if a snapshot is supplied. Returns bytes written."""
+    global _journal_entries
+    written = 0
+    if lines:
+        with open(USER_DATA_JOURNAL, "a") as f:
+            written = f.write("".join(line + "\n" for line in lines))
+        _journal_entries += len(lines)
+    if snapshot is not None:
+        written += _write_snapshot(snapshot)
+    return written
+
+
+def compact_user_data(data: Dict) -> int:
+    """Atomically rewrite the snapshot from `data` and truncate the journal. Returns bytes written."""
+    return _write_snapshot(_serialize_snapshot(data))
+
+
+# Write-behind settings: dirty records are flushed USER_DATA_FLUSH_INTERVAL seconds
+# after the first change, or immediately once USER_DATA_FLUSH_BATCH records are dirty.
+USER_DATA_FLUSH_INTERVAL = float(os.environ.get("USER_DATA_FLUSH_INTERVAL", "1.0"))
+USER_DATA_FLUSH_BATCH = max(1, int(os.environ.get("USER_DATA_FLUSH_BATCH", "100")))
+
+
+class UserDataWriter:
+    """Write-behind buffer for the module-level `user_data` dict.
+
+    Handlers only mark their record dirty; dirty records are serialized on the
+    event loop (so the snapshot is consistent) and written to disk in a thread
+    executor, one batch per flush.
+    """
+
+    def __init__(self, data: Dict, interval: float = USER_DATA_FLUSH_INTERVAL, batch_size: int = USER_DATA_FLUSH_BATCH):
+        self._data = data
+        self._interval = interval
+        self._batch_size = batch_size
+        self._dirty: Set[str] = set()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+
+    def mark_dirty(self, key: str) -> None:
+        self._dirty.add(key)
+        if len(self._dirty) >= self._batch_size:
+            self._flush_soon()
+        elif self._timer is None:
+            self._timer = self._loop.call_later(self._interval, self._flush_soon)
+
+    def _flush_soon(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        task = self._loop.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self) -> None:
+        """Write all dirty records. Flushes are serialized so journal order matches change order."""
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            started = time.perf_counter()
+            lines = [_journal_line(self._data, k) for k in keys]
+            snapshot = None
+            if _journal_entries + len(lines) >= USER_DATA_COMPACT_EVERY:
+                snapshot = _serialize_snapshot(self._data)
+            try:
+                with trace_span("user_data_flush", records=len(keys), snapshot=snapshot is not None):
+                    written = await asyncio.get_running_loop().run_in_executor(None, _append_journal, lines, snapshot)
+            except Exception as e:
+                # Keep the records dirty so the next flush retries them
+                self._dirty.update(keys)
+                logger.error(f"Error saving user data: {e}")
+                _record_user_data_save(started, None)
+            else:
+                _record_user_data_save(started, written)
+
+    async def stop(self) -> None:
+        """Flush everything that is still pending and stop buffering."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+        self._loop = None
+
+    def flush_sync(self) -> None:
+        """Synchronous last-resort flush for when the event loop is already gone."""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        try:
+            _append_journal([_journal_line(self._data, k) for k in keys])
+        except Exception as e:
+            logger.error(f"Error saving user data: {e}")
+        self._loop = None
+
+
+_user_data_writer: Optional[UserDataWriter] = None
+
 
+def save_user_data(data: Dict, key: Optional[str] = None) -> None:
+    """Persist user data.
 
-def save_user_data(data: Dict) -> None:
-    """Save user data to JSON file."""
+    With `key`, only that user's record is appended to the journal (O(record)
+    instead of O(all users)); the journal is compacted into the snapshot every
+    USER_DATA_COMPACT_EVERY entries. Without `key`, the whole dict is compacted.
+    While the bot is running, keyed saves go through the write-behind buffer.
+    """
+    if key is not None and _user_data_writer is not None and _user_data_writer.running and data is user_data:
+        _user_data_writer.mark_dirty(key)
+        return
+    if data is user_data:
+        # Never compact a snapshot from state that has not been loaded yet
+        ensure_user_data_loaded()
+    started = time.perf_counter()
     try:
-        with open(USER_DATA_FILE, "w") as f:
-            json.dump(data, f, indent=2)
+        with trace_span("save_user_data", compact=key is None):
+            if key is None:
+                written = compact_user_data(data)
+            else:
+                snapshot = None
+                if _journal_entries + 1 >= USER_DATA_COMPACT_EVERY:
+                    snapshot = _serialize_snapshot(data)
+                written = _append_journal([_journal_line(data, key)], snapshot)
     except Exception as e:
         logger.error(f"Error saving user data: {e}")
+        _record_user_data_save(started, None)
+    else:
+        _record_user_data_save(started, written)
+
+
+async def _start_user_data_writer(application) -> None:
+    """Application post_init hook: route saves through the write-behind buffer."""
+    global _user_data_writer
+    _user_data_writer = UserDataWriter(user_data)
+    _user_data_writer.start()
+
+
+async def _stop_user_data_writer(application) -> None:
+    """Application post_shutdown hook: flush pending records before exit."""
+    if _user_data_writer is not None:
+        await _user_data_writer.stop()
+
+
+def flush_user_data() -> None:
+    """Flush any records still buffered by the write-behind layer (sync, for shutdown)."""
+    if _user_data_writer is not None:
+        _user_data_writer.flush_sync()
+
+
+# User data is loaded by the application's post_init hook (off the event loop),
+# or on first access when handlers are driven directly by a test harness. The
+# dict object itself never changes, so `from KrisBot import user_data` is safe.
+user_data: Dict[str, UserRecord] = {}
+_user_data_loaded = False
+
+
+def _snapshot_size() -> int:
+    try:
+        return os.path.getsize(USER_DATA_FILE)
+    except OSError:
+        return 0
 
 
-# Initialize user data
-user_data = load_user_data()
+metrics.gauge("krisbot_user_data_records", "Users held in user_data.", lambda: len(user_data))
+metrics.gauge("krisbot_user_data_snapshot_bytes", "Size of the user_data snapshot file.", _snapshot_size)
 
-# Initialize Faker for generating fake data
-fake = Faker()
+
+def ensure_user_data_loaded() -> None:
+    """Load stored user state into `user_data` if that has not happened yet."""
+    global _user_data_loaded
+    if not _user_data_loaded:
+        _user_data_loaded = True
+        user_data.update(load_user_data())
+
+
+async def load_user_data_async() -> None:
+    global _user_data_loaded
+    if not _user_data_loaded:
+        _user_data_loaded = True
+        user_data.update(await asyncio.get_running_loop().run_in_executor(None, load_user_data))
+
+
+@functools.lru_cache(maxsize=None)
+def _faker():
+    """Faker instance for MOCK_MODE, built the first time mock data is needed."""
+    from faker import Faker
+    return Faker()
+
+
+# Outbound HTTP settings shared by every scrape helper
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "20.0"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5.0"))
+HTTP_MAX_CONNECTIONS_PER_HOST = max(1, int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", "20")))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30.0"))
+HTTP2_ENABLED = os.environ.get("HTTP2", "").lower() in ("1", "true", "yes")
+
+# Hosts of the public profile pages the scrapers fetch directly
+PUBLIC_PAGE_HOSTS = frozenset({
+    "tiktok.com", "www.tiktok.com",
+    "instagram.com", "www.instagram.com",
+    "facebook.com", "www.facebook.com", "m.facebook.com",
+})
+# Pool key (and metrics label) for every host that is not a known upstream
+OTHER_HOSTS = "other"
+
+
+@functools.lru_cache(maxsize=8)
+def _upstream_hosts(settings: Settings) -> frozenset:
+    hosts = set(PUBLIC_PAGE_HOSTS)
+    for url in (FORESTAPI_PUBLIC_URL, settings.forestapi_base_url, settings.tiktok_api_url, settings.instagram_api_url):
+        if url:
+            hosts.add(urlsplit(url).hostname or "")
+    return frozenset(hosts)
+
+
+def upstream_host(url: str) -> str:
+    """The host of `url` if the bot talks to it by design, else OTHER_HOSTS.
+
+    Links come from users, so anything keyed by host (client pools, metric labels)
+    goes through here to stay bounded.
+    """
+    return host_label(urlsplit(url).hostname or "")
+
+
+def host_label(host: str) -> str:
+    """`host` itself if it is a known upstream, else OTHER_HOSTS."""
+    return host if host in _upstream_hosts(get_settings()) else OTHER_HOSTS
+
+
+@functools.lru_cache(maxsize=1)
+def _instrumented_client_class(httpx_module) -> type:
+    """httpx.AsyncClient that also records requests which fail before a response."""
+
+    class InstrumentedAsyncClient(httpx_module.AsyncClient):
+        async def send(self, request, **kwargs):
+            try:
+                return await super().send(request, **kwargs)
+            except BaseException as e:
+                _on_http_error(request, e)
+                raise
+
+    return InstrumentedAsyncClient
+
+
+class HttpClientRegistry:
+    """Pooled httpx.AsyncClient instances, one per upstream host.
+
+    Keeping one client per host gives each host its own connection limit and
+    keeps TLS connections to forestapi / the configured APIs warm between lookups.
+    Hosts that are not known upstreams (arbitrary links sent by users) all share a
+    single client, so the number of pools stays fixed.
+    """
+
+    def __init__(
+        self,
+        timeout: float = HTTP_TIMEOUT,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        max_connections: int = HTTP_MAX_CONNECTIONS_PER_HOST,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        http2: bool = HTTP2_ENABLED,
+    ):
+        import httpx
+
+        self._httpx = httpx
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP2 requested but the 'h2' package is not installed; using HTTP/1.1")
+                http2 = False
+        self._http2 = http2
+        self._clients: Dict[str, "httpx.AsyncClient"] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_guard = None
+
+    def _bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Start a new set of clients on `loop`; connections cannot move between loops."""
+        self._clients = {}
+        self._loop = loop
+        # asyncio.run() finalizes the async generators of its loop before closing it.
+        # This one closes the clients on that loop, so scripts that call asyncio.run
+        # repeatedly do not leak the previous run's connections.
+        self._loop_guard = self._close_with_loop(self._clients)
+        loop.create_task(self._start_guard(self._loop_guard))
+
+    @staticmethod
+    async def _close_with_loop(clients: Dict[str, Any]):
+        try:
+            yield
+        finally:
+            await asyncio.gather(*(c.aclose() for c in list(clients.values())), return_exceptions=True)
+
+    @staticmethod
+    async def _start_guard(guard) -> None:
+        await guard.__anext__()
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        """Return the pooled client for the host of `url`, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._bind(loop)
+        host = upstream_host(url)
+        client = self._clients.get(host)
+        if client is None or client.is_closed:
+            client = _instrumented_client_class(self._httpx)(
+                timeout=self._timeout,
+                limits=self._limits,
+                http2=self._http2,
+                event_hooks={"request": [_on_http_request], "response": [_on_http_response]},
+            )
+            self._clients[host] = client
+        return client
+
+    async def aclose(self) -> None:
+        # Cleared in place: the loop guard holds this same dict
+        clients = list(self._clients.values())
+        self._clients.clear()
+        await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
+
+
+_http_clients: Optional[HttpClientRegistry] = None
+
+
+def get_http_client(url: str) -> httpx.AsyncClient:
+    """Return the shared client for `url`'s host from the application-scoped registry."""
+    global _http_clients
+    if _http_clients is None:
+        # Helpers used outside the bot (test_server.py, test_mock.py) get a default registry
+        _http_clients = HttpClientRegistry()
+    return _http_clients.get(url)
+
+
+async def close_http_clients() -> None:
+    if _http_clients is not None:
+        await _http_clients.aclose()
 
 
 def _uid(user_id: int) -> str:
@@ -69,24 +1607,42 @@ def _uid(user_id: int) -> str:
     return str(user_id)
 
 
+def _get_user(key: str) -> Optional[UserRecord]:
+    """Return the record for `key`, or None for a user the bot has not seen."""
+    if not _user_data_loaded:
+        ensure_user_data_loaded()
+    return user_data.get(key)
+
+
+def _user_record(key: str) -> UserRecord:
+    """Return the record for `key`, creating an empty one if the user is new."""
+    record = _get_user(key)
+    if record is None:
+        record = user_data[key] = UserRecord()
+    return record
+
+
+# Message templates shared by several handlers
+MSG_ASK_PHONE = "Thank you! Now please enter your phone number:"
+MSG_SELECT_PLATFORM = "Select a social media platform to interact with:"
+MSG_ONBOARDED = "Great! Now, select a social media platform to interact with:"
+MSG_NEED_DETAILS = "Please provide your email and phone number first using /start."
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
     user = update.effective_user
     key = _uid(user.id)
-    user_data.setdefault(key, {"email": None, "phone": None, "social_media": [], "tiktok_token": None, "fetched_data": {}, "is_adding_platform": False, "awaiting_token": False})
-    save_user_data(user_data)
+    record = _get_user(key)
+    if record is None:
+        record = _user_record(key)
+        save_user_data(user_data, key)
 
-    if user_data[key]["phone"]:
+    if record.phone:
         # User has provided details, show keyboard
-        keyboard = [
-            [InlineKeyboardButton("TikTok", callback_data="tiktok")],
-            [InlineKeyboardButton("Instagram", callback_data="instagram")],
-            [InlineKeyboardButton("Facebook", callback_data="facebook")],
-            [InlineKeyboardButton("Add New Platform", callback_data="add_platform")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = _menu_keyboard_for(key)
         await update.message.reply_text(
-            f"Welcome back {user.first_name}! Select a social media platform to interact with:",
+            f"Welcome back {user.first_name}! {MSG_SELECT_PLATFORM}",
             reply_markup=reply_markup
         )
     else:
@@ -100,10 +1656,9 @@ async def handle_email(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     user = update.effective_user
     email = update.message.text
     key = _uid(user.id)
-    user_data.setdefault(key, {"email": None, "phone": None, "social_media": []})
-    user_data[key]["email"] = email
-    save_user_data(user_data)
-    await update.message.reply_text("Thank you! Now please enter your phone number:")
+    _user_record(key).email = email
+    save_user_data(user_data, key)
+    await update.message.reply_text(MSG_ASK_PHONE)
 
 
 async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -111,19 +1666,12 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     user = update.effective_user
     phone = update.message.text
     key = _uid(user.id)
-    user_data.setdefault(key, {"email": None, "phone": None, "social_media": [], "tiktok_token": None, "instagram_token": None, "facebook_token": None, "fetched_data": {}})
-    user_data[key]["phone"] = phone
-    save_user_data(user_data)
+    _user_record(key).phone = phone
+    save_user_data(user_data, key)
 
-    keyboard = [
-        [InlineKeyboardButton("TikTok", callback_data="tiktok")],
-        [InlineKeyboardButton("Instagram", callback_data="instagram")],
-        [InlineKeyboardButton("Facebook", callback_data="facebook")],
-        [InlineKeyboardButton("Add New Platform", callback_data="add_platform")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = _menu_keyboard_for(key)
     await update.message.reply_text(
-        "Great! Now, select a social media platform to interact with:",
+        MSG_ONBOARDED,
         reply_markup=reply_markup
     )
 
@@ -132,59 +1680,53 @@ async def scrape_tiktok(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     """Scrape TikTok accounts based on user data."""
     user = update.effective_user
     key = _uid(user.id)
-    if not (key in user_data and user_data[key].get("email") and user_data[key].get("phone")):
-        await update.message.reply_text("Please provide your email and phone number first using /start.")
+    record = _get_user(key)
+    if not (record and record.onboarded):
+        await update.message.reply_text(MSG_NEED_DETAILS)
         return
 
-    email = user_data[key]["email"]
-    phone = user_data[key]["phone"]
-    await update.message.reply_text(f"Scraping TikTok accounts for {email} and {phone}...")
+    email = record.email
+    phone = record.phone
 
-    try:
+    async def run(job: Job) -> str:
         results = await perform_tiktok_scrape(email=email, phone=phone)
-    except Exception as e:
-        logger.exception("Error during TikTok scrape")
-        await update.message.reply_text(f"An error occurred while scraping: {e}")
-        return
-
-    # Save results into user_data
-    user_data.setdefault(key, {"email": None, "phone": None, "social_media": []})
-    platform_store = user_data[key].setdefault("platform_data", {})
-    platform_store["tiktok"] = results
-    save_user_data(user_data)
+        # Save results into the scrape history
+        await scrape_history.record(key, "tiktok", f"{email}|{phone}", results)
+        # Send a richer summary back to the user
+        if not results:
+            return "No TikTok accounts found for the provided details."
+        return format_tiktok_summary(results, top_n=3)
 
-    # Send a richer summary back to the user
-    if not results:
-        await update.message.reply_text("No TikTok accounts found for the provided details.")
-    else:
-        text = format_tiktok_summary(results, top_n=3)
-        await update.message.reply_text(text)
+    await job_manager.submit(update, key, "tiktok", f"{email}|{phone}",
+                             f"Scraping TikTok accounts for {email} and {phone}...", run)
 
 
 async def scrape_instagram(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Scrape Instagram accounts based on user data."""
     user = update.effective_user
     key = _uid(user.id)
-    if key in user_data and user_data[key].get("email") and user_data[key].get("phone"):
+    record = _get_user(key)
+    if record and record.onboarded:
         await update.message.reply_text(
-            f"Scraping Instagram accounts for {user_data[key]['email']} and {user_data[key]['phone']}...\n"
+            f"Scraping Instagram accounts for {record.email} and {record.phone}...\n"
             "This feature is currently under development. Please check back later!"
         )
     else:
-        await update.message.reply_text("Please provide your email and phone number first using /start.")
+        await update.message.reply_text(MSG_NEED_DETAILS)
 
 
 async def scrape_facebook(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Scrape Facebook accounts based on user data."""
     user = update.effective_user
     key = _uid(user.id)
-    if key in user_data and user_data[key].get("email") and user_data[key].get("phone"):
+    record = _get_user(key)
+    if record and record.onboarded:
         await update.message.reply_text(
-            f"Scraping Facebook accounts for {user_data[key]['email']} and {user_data[key]['phone']}...\n"
+            f"Scraping Facebook accounts for {record.email} and {record.phone}...\n"
             "This feature is currently under development. Please check back later!"
         )
     else:
-        await update.message.reply_text("Please provide your email and phone number first using /start.")
+        await update.message.reply_text(MSG_NEED_DETAILS)
 
 
 async def scrape_link(update, context) -> None:
@@ -208,40 +1750,34 @@ async def scrape_link(update, context) -> None:
         await update.message.reply_text("Usage: /scrape_link <url> — send a full TikTok/Instagram/Facebook profile URL.")
         return
 
-    await update.message.reply_text("Scraping the provided link — this may take a few seconds.\nNote: scraping public pages may be rate-limited or blocked by the target site.")
-
-    results = []
-    platform = None
     if "tiktok.com" in url:
-        platform = "tiktok"
-        results = await perform_tiktok_scrape_by_url(url)
+        platform, scrape = "tiktok", perform_tiktok_scrape_by_url
     elif "instagram.com" in url:
-        platform = "instagram"
-        results = await perform_instagram_scrape_by_url(url)
+        platform, scrape = "instagram", perform_instagram_scrape_by_url
     elif "facebook.com" in url:
-        platform = "facebook"
-        results = await perform_facebook_scrape_by_url(url)
+        platform, scrape = "facebook", perform_facebook_scrape_by_url
     else:
         await update.message.reply_text("Unrecognized platform in URL. Supported: TikTok, Instagram, Facebook.")
         return
 
-    # persist
-    user_data.setdefault(key, {"email": None, "phone": None, "social_media": []})
-    platform_store = user_data[key].setdefault("platform_data", {})
-    platform_store.setdefault(f"{platform}_links", {})
-    platform_store[f"{platform}_links"][url] = results
-    save_user_data(user_data)
-
-    if not results:
-        await update.message.reply_text("No data found or page inaccessible for the provided URL.")
-    else:
+    async def run(job: Job) -> str:
+        results = await scrape(url)
+        # persist
+        await scrape_history.record(key, f"{platform}_links", url, results)
+        if not results:
+            return "No data found or page inaccessible for the provided URL."
         # If TikTok, use rich formatting
         if platform == "tiktok":
-            text = format_tiktok_summary(results, top_n=3)
-            await update.message.reply_text(text)
-        else:
-            sample = results[0]
-            await update.message.reply_text(f"Found {len(results)} result(s). Example: {sample.get('username')} — {sample.get('url')}")
+            return format_tiktok_summary(results, top_n=3)
+        sample = results[0]
+        return f"Found {len(results)} result(s). Example: {sample.get('username')} — {sample.get('url')}"
+
+    await job_manager.submit(
+        update, key, f"{platform}_links", url,
+        "Scraping the provided link — this may take a few seconds.\n"
+        "Note: scraping public pages may be rate-limited or blocked by the target site.",
+        run,
+    )
 
 
 def format_tiktok_summary(results: List[Dict[str, Any]], top_n: int = 3) -> str:
@@ -274,24 +1810,67 @@ def format_tiktok_summary(results: List[Dict[str, Any]], top_n: int = 3) -> str:
     return "\n".join(lines)
 
 
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight task.
+
+    Every caller awaits the same task and receives its result or exception.
+    Callers wait through asyncio.shield, so cancelling one waiter leaves the
+    shared task running for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: str, factory):
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._done, key))
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter was cancelled
+            task.exception()
+
+
+_inflight = SingleFlight()
+
+
+def _coalesced(key_func):
+    """Route calls through `_inflight` keyed by `key_func(*args, **kwargs)`."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = key_func(*args, **kwargs)
+            return await _inflight.do(key, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+@_coalesced(lambda email, phone: f"tiktok_search:{email}|{phone}")
 async def perform_tiktok_scrape(email: str, phone: str) -> List[Dict[str, Any]]:
     """Perform a TikTok scrape using an external API if configured, otherwise run a local simulation.
 
     Returns a list of dicts with keys like 'username' and 'url'.
     """
-    # Allow a MOCK_MODE which returns deterministic test data without network calls
-    MOCK_MODE = os.environ.get("MOCK_MODE", "").lower() in ("1", "true", "yes")
-
-    api_url = os.environ.get("TIKTOK_API_URL")
-    api_key = os.environ.get("TIKTOK_API_KEY")
+    settings = get_settings()
+    api_url = settings.tiktok_api_url
+    api_key = settings.tiktok_api_key
 
     payload = {"email": email, "phone": phone}
 
-    # Number of mock accounts to generate (bounded)
-    mock_count = int(os.environ.get("TIKTOK_MOCK_COUNT", "5"))
-    mock_count = max(1, min(mock_count, 50))
+    # Number of mock accounts to generate (validated to 1..50 by Settings)
+    mock_count = settings.tiktok_mock_count
 
-    if MOCK_MODE:
+    # MOCK_MODE returns deterministic test data without network calls
+    if settings.mock_mode:
         # Return deterministic mock results for testing. Use a stable hash of the
         # email+phone to generate reproducible follower/likes counts.
         await asyncio.sleep(0.05)
@@ -336,17 +1915,17 @@ async def perform_tiktok_scrape(email: str, phone: str) -> List[Dict[str, Any]]:
         headers = {"Content-Type": "application/json"}
         if api_key:
             headers["Authorization"] = f"Bearer {api_key}"
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(api_url, json=payload, headers=headers)
-            resp.raise_for_status()
-            data = resp.json()
-            if isinstance(data, dict) and "accounts" in data:
-                return data["accounts"]
-            if isinstance(data, list):
-                return data
-            # fallback: wrap dict into list
-            if isinstance(data, dict):
-                return [{"username": data.get("username", "unknown"), "url": data.get("url", "")}]  # type: ignore[arg-type]
+        client = get_http_client(api_url)
+        resp = await client.post(api_url, json=payload, headers=headers, timeout=30.0)
+        resp.raise_for_status()
+        data = resp.json()
+        if isinstance(data, dict) and "accounts" in data:
+            return data["accounts"]
+        if isinstance(data, list):
+            return data
+        # fallback: wrap dict into list
+        if isinstance(data, dict):
+            return [{"username": data.get("username", "unknown"), "url": data.get("url", "")}]  # type: ignore[arg-type]
 
     # Local simulated results (safe fallback) - generate a few plausible accounts
     await asyncio.sleep(0.5)
@@ -364,6 +1943,353 @@ async def perform_tiktok_scrape(email: str, phone: str) -> List[Dict[str, Any]]:
     return simulated
 
 
+class TTLCache:
+    """LRU-bounded cache whose entries also expire after a per-entry TTL."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+# Per-platform TTLs (seconds) for scraped profile results, and the LRU bound
+PROFILE_CACHE_TTL = {
+    "tiktok": float(os.environ.get("PROFILE_CACHE_TTL_TIKTOK", "600")),
+    "instagram": float(os.environ.get("PROFILE_CACHE_TTL_INSTAGRAM", "600")),
+    "facebook": float(os.environ.get("PROFILE_CACHE_TTL_FACEBOOK", "600")),
+}
+profile_cache = TTLCache(maxsize=int(os.environ.get("PROFILE_CACHE_SIZE", "1024")))
+
+# Share/tracking query parameters that do not change which profile a URL points at
+_TRACKING_PARAMS = {"igshid", "igsh", "fbclid", "mibextid", "_t", "_r", "is_from_webapp", "sender_device", "ref", "refsrc", "lang"}
+
+
+def normalize_profile_url(url: str) -> str:
+    """Canonicalize a profile URL for use as a cache key.
+
+    http/https and www./m. prefixes are unified, the default port, fragment and a
+    trailing slash are dropped, tracking parameters are removed and the remaining
+    query parameters are sorted.
+    """
+    parts = urlsplit(url.strip())
+    scheme = "https" if parts.scheme.lower() in ("http", "https", "") else parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in _TRACKING_PARAMS and not k.lower().startswith("utm_")
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+# Persistent response cache for GET lookups, revalidated with ETag / Last-Modified
+HTTP_CACHE_DIR = os.environ.get("HTTP_CACHE_DIR", ".http_cache")
+HTTP_CACHE_MAX_BYTES = int(os.environ.get("HTTP_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+class DiskResponseCache:
+    """On-disk cache of parsed GET results together with their HTTP validators.
+
+    Each URL is stored as one JSON file holding the ETag / Last-Modified values
+    and the already-parsed result, so a 304 skips both the body download and
+    re-parsing. Total size is capped; the least recently used entries (by file
+    mtime, which is refreshed on every hit) are evicted first. File IO runs in
+    the default executor.
+    """
+
+    def __init__(self, directory: str = HTTP_CACHE_DIR, max_bytes: int = HTTP_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index: Optional["OrderedDict[str, int]"] = None
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_index(self) -> "OrderedDict[str, int]":
+        """Scan the cache directory once, oldest access first."""
+        entries = []
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".json") and entry.is_file():
+                    st = entry.stat()
+                    entries.append((st.st_mtime, entry.name, st.st_size))
+        entries.sort()
+        return OrderedDict((name, size) for _, name, size in entries)
+
+    async def _ensure_index(self) -> "OrderedDict[str, int]":
+        if self._index is None:
+            index = await asyncio.get_running_loop().run_in_executor(None, self._load_index)
+            if self._index is None:
+                self._index = index
+                self._bytes = sum(index.values())
+        return self._index
+
+    @staticmethod
+    def _name(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json"
+
+    def _read(self, name: str) -> Optional[Dict[str, Any]]:
+        path = self._path(name)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+            os.utime(path)
+            return entry
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _write(self, name: str, serialized: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # A unique temporary file: concurrent writers of the same URL must not share one
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(serialized)
+            os.replace(tmp_path, self._path(name))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _remove(self, evict: List[str]) -> None:
+        for old in evict:
+            try:
+                os.remove(self._path(old))
+            except OSError:
+                pass
+
+    async def get(self, url: str) -> Optional[Dict[str, Any]]:
+        index = await self._ensure_index()
+        name = self._name(url)
+        if name not in index:
+            self.misses += 1
+            return None
+        entry = await asyncio.get_running_loop().run_in_executor(None, self._read, name)
+        if entry is None or entry.get("url") != url:
+            self.misses += 1
+            return None
+        index.move_to_end(name)
+        self.hits += 1
+        return entry
+
+    async def put(self, url: str, etag: Optional[str], last_modified: Optional[str], result: Any) -> None:
+        """Store `result` for `url`. Write errors are logged, never raised: the cache is optional."""
+        index = await self._ensure_index()
+        name = self._name(url)
+        serialized = json.dumps({
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": time.time(),
+            "result": result,
+        }, separators=(",", ":"))
+        size = len(serialized.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._write, name, serialized)
+        except OSError as e:
+            # e.g. disk full or a read-only directory; the caller still gets its result
+            logger.warning("Could not write HTTP cache entry for %s: %s", url, e)
+            return
+        # Accounted only once the file is in place
+        self._bytes += size - index.pop(name, 0)
+        index[name] = size
+        evict: List[str] = []
+        while self._bytes > self.max_bytes and len(index) > 1:
+            old, old_size = index.popitem(last=False)
+            self._bytes -= old_size
+            evict.append(old)
+        self.evictions += len(evict)
+        self.stores += 1
+        if evict:
+            await loop.run_in_executor(None, self._remove, evict)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._index or ()),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+
+response_cache = DiskResponseCache()
+
+
+def _validator_headers(entry: Optional[Dict[str, Any]], headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Request headers plus If-None-Match / If-Modified-Since from a cached entry."""
+    req_headers = dict(headers or {})
+    if entry is not None:
+        if entry.get("etag"):
+            req_headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            req_headers["If-Modified-Since"] = entry["last_modified"]
+    return req_headers
+
+
+async def _store_validated(url: str, resp, result: Any) -> None:
+    """Cache `result` for `url` if the response carried a validator."""
+    etag = resp.headers.get("ETag")
+    last_modified = resp.headers.get("Last-Modified")
+    if etag or last_modified:
+        await response_cache.put(url, etag, last_modified, result)
+
+
+async def _revalidating_get(url: str, parse, timeout: float = 20.0, headers: Optional[Dict[str, str]] = None) -> Optional[Any]:
+    """GET `url` through the shared client, revalidating against `response_cache`.
+
+    Returns `parse(response)` for a 200, the cached parse result for a 304, and
+    None for any other status.
+    """
+    entry = await response_cache.get(url)
+    client = get_http_client(url)
+    resp = await client.get(url, headers=_validator_headers(entry, headers), timeout=timeout)
+    if resp.status_code == 304 and entry is not None:
+        response_cache.revalidated += 1
+        return entry["result"]
+    if resp.status_code != 200:
+        return None
+    result = parse(resp)
+    await _store_validated(url, resp, result)
+    return result
+
+
+# Byte budget for scanning public profile pages, which are often several MB
+PAGE_FETCH_MAX_BYTES = int(os.environ.get("PAGE_FETCH_MAX_BYTES", str(256 * 1024)))
+_HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+_PAGE_USERNAME_RE = re.compile(r"@([A-Za-z0-9_.-]{2,})")
+
+
+async def _scan_stream(resp, pattern: "re.Pattern", max_bytes: int, overlap: int = 256) -> Optional[str]:
+    """Search a streamed body chunk by chunk and return group(1) of the first match.
+
+    Stops as soon as a match is complete or `max_bytes` have been downloaded. A
+    match touching the end of the current window may continue in the next chunk,
+    so it is only accepted once more text follows it.
+    """
+    tail = ""
+    async for chunk in resp.aiter_text():
+        window = tail + chunk
+        m = pattern.search(window)
+        if m and m.end() < len(window):
+            return m.group(1)
+        tail = window[m.start():] if m else window[-overlap:]
+        if resp.num_bytes_downloaded >= max_bytes:
+            break
+    m = pattern.search(tail)
+    return m.group(1) if m else None
+
+
+async def _scan_profile_page(url: str, build, pattern: Optional["re.Pattern"] = None, timeout: float = 20.0, max_bytes: int = PAGE_FETCH_MAX_BYTES) -> Optional[Any]:
+    """Stream a public HTML page and return `build(match)`.
+
+    Non-200 responses and non-HTML content types are rejected from the headers
+    alone. With `pattern` None the body is never read; otherwise it is scanned
+    incrementally via `_scan_stream`. Results are revalidated like `_revalidating_get`.
+    """
+    entry = await response_cache.get(url)
+    client = get_http_client(url)
+    async with client.stream("GET", url, headers=_validator_headers(entry), timeout=timeout) as resp:
+        if resp.status_code == 304 and entry is not None:
+            response_cache.revalidated += 1
+            return entry["result"]
+        if resp.status_code != 200:
+            return None
+        content_type = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type and content_type not in _HTML_CONTENT_TYPES:
+            return None
+        match = await _scan_stream(resp, pattern, max_bytes) if pattern is not None else None
+        result = build(match)
+    await _store_validated(url, resp, result)
+    return result
+
+
+def _cached_profile_scrape(platform: str):
+    """Serve a perform_*_scrape_by_url helper from `profile_cache` when possible.
+
+    Cache misses are coalesced through `_inflight`. Only non-empty results are cached, so transient failures are retried on the next call.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(url: str) -> List[Dict[str, Any]]:
+            key = f"{platform}:{normalize_profile_url(url)}"
+            cached = profile_cache.get(key)
+            if cached is not None:
+                return list(cached)
+
+            async def fetch() -> List[Dict[str, Any]]:
+                results = await func(url)
+                if results:
+                    profile_cache.set(key, list(results), PROFILE_CACHE_TTL[platform])
+                return results
+
+            # Concurrent misses for the same normalized URL share one fetch
+            return list(await _inflight.do(key, fetch))
+        return wrapper
+    return decorator
+
+
+def _forestapi_username(url: str, platform: str) -> Optional[str]:
+    """Username from a forestapi user URL, on the public host or FORESTAPI_BASE_URL."""
+    m = re.match(rf"https?://forestapi\.vercel\.app/api/{platform}/user/([A-Za-z0-9_.-]+)", url)
+    if m is None:
+        base = re.escape(get_settings().forestapi_base_url)
+        m = re.match(rf"{base}/api/{platform}/user/([A-Za-z0-9_.-]+)", url)
+    return m.group(1) if m else None
+
+
+@_cached_profile_scrape("tiktok")
 async def perform_tiktok_scrape_by_url(url: str) -> List[Dict[str, Any]]:
     """Scrape TikTok profile information from a direct profile URL.
 
@@ -372,14 +2298,11 @@ async def perform_tiktok_scrape_by_url(url: str) -> List[Dict[str, Any]]:
     Returns a list of profile dicts (keeps same shape as other scrape helpers).
     """
     # If the URL matches forestapi.vercel.app/api/tiktok/user/<username>, call it directly
-    m = re.match(r"https?://forestapi\.vercel\.app/api/tiktok/user/([A-Za-z0-9_.-]+)", url)
-    if m:
-        username = m.group(1)
-        api_url = f"https://forestapi.vercel.app/api/tiktok/user/{username}"
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            resp = await client.get(api_url)
-            if resp.status_code != 200:
-                return []
+    username = _forestapi_username(url, "tiktok")
+    if username:
+        api_url = f"{get_settings().forestapi_base_url}/api/tiktok/user/{username}"
+
+        def _parse(resp) -> List[Dict[str, Any]]:
             data = resp.json()
             # forestapi returns { user: {...}, stats: {...}, ... }
             user = data.get("user", {})
@@ -398,59 +2321,51 @@ async def perform_tiktok_scrape_by_url(url: str) -> List[Dict[str, Any]]:
             }
             return [profile]
 
-    # Fallback: fetch the public page and attempt simple extraction
-    try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            r = await client.get(url)
-            if r.status_code != 200:
-                return []
-            text = r.text
-    except Exception:
-        return []
+        return await _revalidating_get(api_url, _parse, timeout=20.0) or []
 
-    # Heuristic: extract @username from URL or page
+    # Fallback: fetch the public page and attempt simple extraction.
+    # Heuristic: extract @username from URL, only scanning the page if that fails
     m = re.search(r"/@([^/?#&\\]+)", url)
-    username = None
-    if m:
-        username = m.group(1)
-    else:
-        m2 = re.search(r"@([A-Za-z0-9_.-]{2,})", text)
-        if m2:
-            username = m2.group(1)
+    url_username = m.group(1) if m else None
 
-    profile = {"username": username or "unknown", "url": url, "raw_status": 200}
-    return [profile]
+    def _build(page_username: Optional[str]) -> List[Dict[str, Any]]:
+        profile = {"username": url_username or page_username or "unknown", "url": url, "raw_status": 200}
+        return [profile]
 
+    try:
+        pattern = None if url_username else _PAGE_USERNAME_RE
+        return await _scan_profile_page(url, _build, pattern=pattern, timeout=20.0) or []
+    except Exception:
+        return []
 
+
+@_cached_profile_scrape("instagram")
 async def perform_instagram_scrape_by_url(url: str) -> List[Dict[str, Any]]:
-    MOCK_MODE = os.environ.get("MOCK_MODE", "").lower() in ("1", "true", "yes")
+    settings = get_settings()
 
-    if MOCK_MODE:
+    if settings.mock_mode:
         # Generate mock Instagram profile data
         await asyncio.sleep(0.05)
-        username = fake.user_name()
+        username = _faker().user_name()
         profile = {
             "username": username,
             "url": url,
-            "full_name": fake.name(),
+            "full_name": _faker().name(),
             "avatar": f"https://example.com/avatars/{username}.jpg",
-            "followers": fake.random_int(min=1000, max=1000000),
-            "following": fake.random_int(min=100, max=5000),
-            "posts": fake.random_int(min=10, max=1000),
-            "bio": fake.sentence(),
+            "followers": _faker().random_int(min=1000, max=1000000),
+            "following": _faker().random_int(min=100, max=5000),
+            "posts": _faker().random_int(min=10, max=1000),
+            "bio": _faker().sentence(),
             "raw": {"mock": True}
         }
         return [profile]
 
     # If the URL matches forestapi.vercel.app/api/instagram/user/<username>, call it directly
-    m = re.match(r"https?://forestapi\.vercel\.app/api/instagram/user/([A-Za-z0-9_.-]+)", url)
-    if m:
-        username = m.group(1)
-        api_url = f"https://forestapi.vercel.app/api/instagram/user/{username}"
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            resp = await client.get(api_url)
-            if resp.status_code != 200:
-                return []
+    username = _forestapi_username(url, "instagram")
+    if username:
+        api_url = f"{settings.forestapi_base_url}/api/instagram/user/{username}"
+
+        def _parse(resp) -> List[Dict[str, Any]]:
             data = resp.json()
             # forestapi returns { user: {...}, stats: {...}, ... }
             user = data.get("user", {})
@@ -468,87 +2383,80 @@ async def perform_instagram_scrape_by_url(url: str) -> List[Dict[str, Any]]:
             }
             return [profile]
 
-    api_url = os.environ.get("INSTAGRAM_API_URL")
-    api_key = os.environ.get("INSTAGRAM_API_KEY")
+        return await _revalidating_get(api_url, _parse, timeout=20.0) or []
+
+    api_url = settings.instagram_api_url
+    api_key = settings.instagram_api_key
     payload = {"url": url}
     if api_url:
         headers = {"Content-Type": "application/json"}
         if api_key:
             headers["Authorization"] = f"Bearer {api_key}"
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(api_url, json=payload, headers=headers)
-            resp.raise_for_status()
-            data = resp.json()
-            if isinstance(data, dict) and "accounts" in data:
-                return data["accounts"]
-            if isinstance(data, list):
-                return data
-            if isinstance(data, dict):
-                return [{"username": data.get("username", "unknown"), "url": data.get("url", url)}]
+        client = get_http_client(api_url)
+        resp = await client.post(api_url, json=payload, headers=headers, timeout=30.0)
+        resp.raise_for_status()
+        data = resp.json()
+        if isinstance(data, dict) and "accounts" in data:
+            return data["accounts"]
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            return [{"username": data.get("username", "unknown"), "url": data.get("url", url)}]
+
+    m = re.search(r"instagram.com/([A-Za-z0-9_.-]{1,})", url)
+    url_username = m.group(1) if m else None
+
+    def _build(page_username: Optional[str]) -> List[Dict[str, Any]]:
+        profile = {"username": url_username or page_username or "unknown", "url": url, "raw_status": 200}
+        return [profile]
 
     try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            r = await client.get(url)
-            if r.status_code != 200:
-                return []
-            text = r.text
+        pattern = None if url_username else _PAGE_USERNAME_RE
+        return await _scan_profile_page(url, _build, pattern=pattern, timeout=20.0) or []
     except Exception:
         return []
 
-    m = re.search(r"instagram.com/([A-Za-z0-9_.-]{1,})", url)
-    username = m.group(1) if m else None
-    if not username:
-        m2 = re.search(r"@([A-Za-z0-9_.-]{2,})", text)
-        if m2:
-            username = m2.group(1)
-
-    profile = {"username": username or "unknown", "url": url, "raw_status": 200}
-    return [profile]
-
 
+@_cached_profile_scrape("facebook")
 async def perform_facebook_scrape_by_url(url: str) -> List[Dict[str, Any]]:
-    MOCK_MODE = os.environ.get("MOCK_MODE", "").lower() in ("1", "true", "yes")
-
-    if MOCK_MODE:
+    if get_settings().mock_mode:
         # Generate mock Facebook profile data
         await asyncio.sleep(0.05)
-        username = fake.user_name()
+        username = _faker().user_name()
         profile = {
             "username": username,
             "url": url,
-            "full_name": fake.name(),
+            "full_name": _faker().name(),
             "avatar": f"https://example.com/avatars/{username}.jpg",
-            "friends": fake.random_int(min=100, max=5000),
-            "posts": fake.random_int(min=10, max=1000),
-            "bio": fake.sentence(),
+            "friends": _faker().random_int(min=100, max=5000),
+            "posts": _faker().random_int(min=10, max=1000),
+            "bio": _faker().sentence(),
             "raw": {"mock": True}
         }
         return [profile]
 
     # Similar minimal fallback for Facebook public pages
+    m = re.search(r"facebook.com/([A-Za-z0-9_.-]{1,})", url)
+    username = m.group(1) if m else None
+
+    def _build(_page_username: Optional[str]) -> List[Dict[str, Any]]:
+        profile = {"username": username or "unknown", "url": url, "raw_status": 200}
+        return [profile]
+
     try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            r = await client.get(url)
-            if r.status_code != 200:
-                return []
-            text = r.text
+        # The page itself is never parsed for Facebook; only its status and type matter
+        return await _scan_profile_page(url, _build, timeout=20.0) or []
     except Exception:
         return []
 
-    m = re.search(r"facebook.com/([A-Za-z0-9_.-]{1,})", url)
-    username = m.group(1) if m else None
-    profile = {"username": username or "unknown", "url": url, "raw_status": 200}
-    return [profile]
-
 
 async def add_social_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Allow users to add a new social media platform."""
     user = update.effective_user
     await update.message.reply_text("Please enter the name of the new social media platform:")
     key = _uid(user.id)
-    user_data.setdefault(key, {"email": None, "phone": None, "social_media": []})
-    user_data[key]["is_adding_platform"] = True
-    save_user_data(user_data)
+    _user_record(key).is_adding_platform = True
+    save_user_data(user_data, key)
 
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -556,54 +2464,167 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     user = update.effective_user
     text = update.message.text
     key = _uid(user.id)
-    user_data.setdefault(key, {"email": None, "phone": None, "social_media": [], "tiktok_token": None, "fetched_data": {}, "is_adding_platform": False, "awaiting_token": False})
+    record = _user_record(key)
 
-    MOCK_MODE = os.environ.get("MOCK_MODE", "").lower() in ("1", "true", "yes")
+    mock_mode = _settings_for(context).mock_mode
 
-    if user_data[key]["email"] is None:
+    if record.email is None:
         # Store email or generate fake if MOCK_MODE
-        if MOCK_MODE and not text.strip():
-            user_data[key]["email"] = fake.email()
+        if mock_mode and not text.strip():
+            record.email = _faker().email()
         else:
-            user_data[key]["email"] = text
-        save_user_data(user_data)
-        await update.message.reply_text("Thank you! Now please enter your phone number:")
-    elif user_data[key]["phone"] is None:
+            record.email = text
+        save_user_data(user_data, key)
+        await update.message.reply_text(MSG_ASK_PHONE)
+    elif record.phone is None:
         # Store phone or generate fake if MOCK_MODE
-        if MOCK_MODE and not text.strip():
-            user_data[key]["phone"] = fake.phone_number()
+        if mock_mode and not text.strip():
+            record.phone = _faker().phone_number()
         else:
-            user_data[key]["phone"] = text
-        save_user_data(user_data)
-        keyboard = [
-            [InlineKeyboardButton("TikTok", callback_data="tiktok")],
-            [InlineKeyboardButton("Instagram", callback_data="instagram")],
-            [InlineKeyboardButton("Facebook", callback_data="facebook")],
-            [InlineKeyboardButton("Add New Platform", callback_data="add_platform")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+            record.phone = text
+        save_user_data(user_data, key)
+        reply_markup = _menu_keyboard_for(key)
         await update.message.reply_text(
-            "Great! Now, select a social media platform to interact with:",
+            MSG_ONBOARDED,
             reply_markup=reply_markup
         )
-    elif user_data[key]["awaiting_token"]:
+    elif record.awaiting_token:
         # Store token based on awaiting_platform
-        platform = user_data[key].get("awaiting_platform", "tiktok")
-        user_data[key][f"{platform}_token"] = text
-        user_data[key]["awaiting_token"] = False
-        user_data[key]["awaiting_platform"] = False
-        save_user_data(user_data)
+        platform = record.awaiting_platform or "tiktok"
+        record.tokens[platform] = text
+        record.awaiting_token = False
+        record.awaiting_platform = None
+        save_user_data(user_data, key)
         await update.message.reply_text(f"Token stored successfully for {platform}. You can now fetch user info.")
-    elif user_data[key]["is_adding_platform"]:
+    elif record.is_adding_platform:
         # Add new platform
-        user_data[key]["social_media"].append(text)
-        user_data[key]["is_adding_platform"] = False
-        save_user_data(user_data)
+        record.social_media.append(text)
+        record.is_adding_platform = False
+        save_user_data(user_data, key)
         await update.message.reply_text(f"Added '{text}' to your social media platforms.")
     else:
         await update.message.reply_text("Please use the buttons or commands. If you need help, type /help.")
 
 
+async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the user's most recent scrapes. Usage: /history [kind]"""
+    key = _uid(update.effective_user.id)
+    args = context.args if getattr(context, 'args', None) else []
+    kind = args[0] if args else None
+    entries = await scrape_history.history(key, kind=kind, limit=10)
+    if not entries:
+        await update.message.reply_text("No scrape history yet.")
+        return
+    lines = ["Recent scrapes:"]
+    for entry in entries:
+        result = entry["result"]
+        count = len(result) if isinstance(result, list) else 1
+        item = f" {entry['item']}" if entry["item"] else ""
+        lines.append(f"- {entry['kind']}{item}: {count} result(s)")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def cancel_job(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Cancel one of the user's running or queued jobs. Usage: /cancel [job_id]"""
+    key = _uid(update.effective_user.id)
+    args = context.args if getattr(context, 'args', None) else []
+    if args:
+        job_id = args[0]
+    else:
+        jobs = job_manager.active_jobs(key)
+        if not jobs:
+            await update.message.reply_text("You have no running jobs.")
+            return
+        job_id = max(jobs, key=lambda job: job.created_at).id
+    if not await job_manager.cancel(key, job_id):
+        await update.message.reply_text(f"No running job {job_id}. Use /job {job_id} to see how it ended.")
+        return
+    await update.message.reply_text(f"Cancelling job {job_id}.")
+
+
+async def show_job(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the status and result of a job. Usage: /job <job_id>"""
+    key = _uid(update.effective_user.id)
+    args = context.args if getattr(context, 'args', None) else []
+    if not args:
+        await update.message.reply_text("Usage: /job <job_id>")
+        return
+    job = await scrape_history.job(key, args[0])
+    if job is None:
+        await update.message.reply_text(f"No job {args[0]} found.")
+        return
+    text = f"Job {job['id']} ({job['kind']}): {job['status']}"
+    if job["result"]:
+        text += "\n" + job["result"]
+    await update.message.reply_text(text)
+
+
+async def cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Report profile / response cache statistics. Usage: /cachestats"""
+    mem = profile_cache.stats()
+    disk = response_cache.stats()
+    sched = update_scheduler.stats()
+    sends = send_pacer.stats()
+    names = username_cache.memory.stats()
+    await update.message.reply_text(
+        "Profile cache (memory):\n"
+        f"  entries: {mem['size']}/{mem['maxsize']}, hits: {mem['hits']}, misses: {mem['misses']}, evictions: {mem['evictions']}\n"
+        "Username existence cache:\n"
+        f"  entries: {names['size']}/{names['maxsize']}, hits: {names['hits']}, misses: {names['misses']}\n"
+        "Response cache (disk):\n"
+        f"  entries: {disk['entries']}, size: {disk['bytes']}/{disk['max_bytes']} bytes\n"
+        f"  hits: {disk['hits']}, misses: {disk['misses']}, revalidated (304): {disk['revalidated']}, "
+        f"stores: {disk['stores']}, evictions: {disk['evictions']}\n"
+        f"In-flight lookups: {len(_inflight)}\n"
+        f"Background jobs: {len(job_manager)} active, {job_manager.pending()} queued\n"
+        "Update scheduler:\n"
+        f"  running: {sched['active']}/{sched['max_concurrent']}, queued: {sched['queued']} (peak {sched['peak_queued']}), "
+        f"users: {sched['users']}, deepest user queue: {sched['deepest_user_queue']}, processed: {sched['processed']}\n"
+        "Outbound messages:\n"
+        f"  sent: {sends['sent']}, paced: {sends['delayed']}, merged edits: {sends['merged']}, "
+        f"429 retries: {sends['retried']}, chats tracked: {sends['chats']}"
+    )
+
+
+async def reload_config(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Re-read ENV_FILE and the environment and swap in new settings. Usage: /reload_config
+
+    Only users listed in ADMIN_IDS may run it; with ADMIN_IDS unset the command is disabled.
+    """
+    current = _settings_for(context)
+    user = update.effective_user
+    if not current.admin_ids:
+        await update.message.reply_text("/reload_config is disabled. Set ADMIN_IDS to enable it.")
+        return
+    if user is None or user.id not in current.admin_ids:
+        await update.message.reply_text("You are not allowed to reload the configuration.")
+        return
+
+    try:
+        settings = reload_settings()
+    except ValueError as e:
+        logger.warning("Configuration reload rejected: %s", e)
+        await update.message.reply_text(f"Configuration not reloaded: {e}")
+        return
+    context.bot_data["settings"] = settings
+    logger.info("Configuration reloaded by %s", user.id)
+    scope = ""
+    broadcast = context.bot_data.get("reload_broadcast")
+    if broadcast is not None:
+        # Under supervisor.py each worker process holds its own settings
+        scope = f" It is being applied in all {broadcast()} workers."
+
+    changed = []
+    for f in dataclasses.fields(Settings):
+        old, new = getattr(current, f.name), getattr(settings, f.name)
+        if old == new:
+            continue
+        # never echo secrets back into the chat
+        changed.append(f"{f.name}: updated" if f.name.endswith("_key") else f"{f.name}: {old!r} -> {new!r}")
+    await update.message.reply_text(
+        f"Configuration reloaded.{scope}\n" + ("\n".join(changed) if changed else "No changes."))
+
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Provide help information to the user."""
     await update.message.reply_text(
@@ -616,194 +2637,608 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     )
 
 
+@_coalesced(lambda token: "tiktok_user_info:" + hashlib.sha256(token.encode("utf-8")).hexdigest())
+async def fetch_tiktok_user_info(token: str) -> Optional[Dict[str, Any]]:
+    """Fetch the TikTok user info for an access token. Returns None on a non-200 response."""
+    url = "https://open-api.tiktok.com/user/info/"
+    headers = {"Authorization": f"Bearer {token}"}
+    client = get_http_client(url)
+    resp = await client.get(url, headers=headers, timeout=30.0)
+    if resp.status_code != 200:
+        return None
+    api_data = resp.json()
+    return api_data.get("data", {})
+
+
+async def _simulated_instagram_info(token: str) -> Optional[Dict[str, Any]]:
+    # Simulate fetching Instagram user info
+    return {
+        "user_id": "123456789",
+        "display_name": "John Doe",
+        "profile_picture_url": "https://example.com/pic.jpg",
+        "follower_count": 1000,
+        "following_count": 500,
+        "likes_count": 2000,
+        "video_count": 50,
+        "profile_description": "Bio here"
+    }
+
+
+async def _simulated_facebook_info(token: str) -> Optional[Dict[str, Any]]:
+    # Simulate fetching Facebook user info
+    return {
+        "user_id": "987654321",
+        "display_name": "Jane Doe",
+        "profile_picture_url": "https://example.com/fbpic.jpg",
+        "friend_count": 500,
+        "follower_count": 2000,
+        "following_count": 300,
+        "likes_count": 1500,
+        "post_count": 100,
+        "profile_description": "About me"
+    }
+
+
+@dataclass(frozen=True)
+class Platform:
+    """A platform offered in the main menu.
+
+    `fetch_info` takes the user's access token and returns the profile dict (or
+    None on failure); `info_fields` lists (label, key) pairs used to render it.
+    """
+
+    key: str
+    label: str
+    fetch_info: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+    info_fields: Tuple[Tuple[str, str], ...]
+
+
+PLATFORMS: Dict[str, Platform] = {}
+
+
+# Keyboards are immutable once built, so one instance can be shared by every
+# message. They are built on first use (warmed in build_application) and the
+# caches are cleared whenever PLATFORMS changes.
+_CUSTOM_CALLBACK_PREFIX = "custom"
+# Telegram limits callback_data to 64 bytes
+_CALLBACK_DATA_MAX_BYTES = 64
+
+
+@functools.lru_cache(maxsize=None)
+def _main_menu_keyboard() -> InlineKeyboardMarkup:
+    """Main platform menu generated from PLATFORMS."""
+    from telegram import InlineKeyboardMarkup
+
+    return InlineKeyboardMarkup(_main_menu_rows())
+
+
+def _main_menu_rows() -> List[List[InlineKeyboardButton]]:
+    from telegram import InlineKeyboardButton
+
+    keyboard = [[InlineKeyboardButton(p.label, callback_data=p.key)] for p in PLATFORMS.values()]
+    keyboard.append([InlineKeyboardButton("Add New Platform", callback_data="add_platform")])
+    return keyboard
+
+
+@functools.lru_cache(maxsize=1024)
+def _custom_menu_keyboard(custom: Tuple[str, ...]) -> InlineKeyboardMarkup:
+    """Main menu plus the user's own platforms, memoized by the platform list.
+
+    Users with the same custom list share one instance; when a user's list
+    changes their next lookup simply uses a different cache key.
+    """
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+    keyboard = _main_menu_rows()
+    insert_at = len(keyboard) - 1
+    for name in custom:
+        data = f"{_CUSTOM_CALLBACK_PREFIX}:{name}"
+        if len(data.encode("utf-8")) > _CALLBACK_DATA_MAX_BYTES:
+            continue
+        keyboard.insert(insert_at, [InlineKeyboardButton(name, callback_data=data)])
+        insert_at += 1
+    return InlineKeyboardMarkup(keyboard)
+
+
+def _menu_keyboard_for(key: str) -> InlineKeyboardMarkup:
+    """Main menu for a user, including the custom platforms from their `social_media` list."""
+    record = _get_user(key)
+    custom = record.social_media if record is not None else ()
+    if not custom:
+        return _main_menu_keyboard()
+    # Drop duplicates while keeping the order the user added them in
+    return _custom_menu_keyboard(tuple(dict.fromkeys(custom)))
+
+
+@functools.lru_cache(maxsize=None)
+def _platform_menu_keyboard(platform: Platform) -> InlineKeyboardMarkup:
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+    keyboard = [
+        [InlineKeyboardButton(f"Login to {platform.label}", callback_data=f"{platform.key}_login")],
+        [InlineKeyboardButton("Fetch User Info", callback_data=f"{platform.key}_fetch")],
+        [InlineKeyboardButton("Back", callback_data="back")],
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+@functools.lru_cache(maxsize=None)
+def _back_keyboard() -> InlineKeyboardMarkup:
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+    return InlineKeyboardMarkup([[InlineKeyboardButton("Back", callback_data="back")]])
+
+
+def _clear_keyboard_cache() -> None:
+    for cached in (_main_menu_keyboard, _custom_menu_keyboard, _platform_menu_keyboard):
+        cached.cache_clear()
+
+
+def warm_keyboard_cache() -> None:
+    """Build the shared keyboards up front so the first button press does not pay for it."""
+    _main_menu_keyboard()
+    _back_keyboard()
+    for platform in PLATFORMS.values():
+        _platform_menu_keyboard(platform)
+
+
+def register_platform(platform: Platform) -> Platform:
+    """Add a platform to the main menu; its callback routes are derived from it."""
+    PLATFORMS[platform.key] = platform
+    _clear_keyboard_cache()
+    return platform
+
+
+register_platform(Platform(
+    key="tiktok",
+    label="TikTok",
+    fetch_info=fetch_tiktok_user_info,
+    info_fields=(
+        ("User ID", "user_id"),
+        ("Display Name", "display_name"),
+        ("Profile Picture", "avatar_url"),
+        ("Follower Count", "follower_count"),
+        ("Following Count", "following_count"),
+        ("Likes Count", "likes_count"),
+        ("Video Count", "video_count"),
+        ("Profile Description", "signature"),
+    ),
+))
+register_platform(Platform(
+    key="instagram",
+    label="Instagram",
+    fetch_info=_simulated_instagram_info,
+    info_fields=(
+        ("User ID", "user_id"),
+        ("Display Name", "display_name"),
+        ("Profile Picture", "profile_picture_url"),
+        ("Follower Count", "follower_count"),
+        ("Following Count", "following_count"),
+        ("Likes Count", "likes_count"),
+        ("Video Count", "video_count"),
+        ("Profile Description", "profile_description"),
+    ),
+))
+register_platform(Platform(
+    key="facebook",
+    label="Facebook",
+    fetch_info=_simulated_facebook_info,
+    info_fields=(
+        ("User ID", "user_id"),
+        ("Display Name", "display_name"),
+        ("Profile Picture", "profile_picture_url"),
+        ("Friend Count", "friend_count"),
+        ("Follower Count", "follower_count"),
+        ("Following Count", "following_count"),
+        ("Likes Count", "likes_count"),
+        ("Post Count", "post_count"),
+        ("Profile Description", "profile_description"),
+    ),
+))
+
+
+async def _cb_platform_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, platform: Platform) -> None:
+    await update.callback_query.edit_message_text(f"{platform.label} Options:", reply_markup=_platform_menu_keyboard(platform))
+
+
+async def _cb_platform_login(update: Update, context: ContextTypes.DEFAULT_TYPE, platform: Platform) -> None:
+    query = update.callback_query
+    key = _uid(query.from_user.id)
+    await query.edit_message_text(f"Please reply with your {platform.label} access token.")
+    record = _user_record(key)
+    record.awaiting_token = True
+    record.awaiting_platform = platform.key
+    save_user_data(user_data, key)
+
+
+async def _cb_platform_fetch(update: Update, context: ContextTypes.DEFAULT_TYPE, platform: Platform) -> None:
+    query = update.callback_query
+    key = _uid(query.from_user.id)
+    record = _get_user(key)
+    token = record.tokens.get(platform.key) if record is not None else None
+    if not token:
+        await query.edit_message_text(f"Please login to {platform.label} first.")
+        return
+    try:
+        user_info = await platform.fetch_info(token)
+    except Exception as e:
+        await query.edit_message_text(f"Error fetching data: {str(e)}")
+        return
+    if user_info is None:
+        await query.edit_message_text("Failed to fetch user info. Check token or API.")
+        return
+    _user_record(key).fetched_data[platform.key] = user_info
+    save_user_data(user_data, key)
+    info_text = "\n".join(f"{label}: {user_info.get(field)}" for label, field in platform.info_fields)
+    await query.edit_message_text(f"Fetched {platform.label} User Info:\n{info_text}")
+
+
+async def _cb_add_platform(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    key = _uid(query.from_user.id)
+    await query.edit_message_text("Please reply with the name of the new platform.")
+    _user_record(key).is_adding_platform = True
+    save_user_data(user_data, key)
+
+
+async def _cb_back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.edit_message_text(MSG_SELECT_PLATFORM, reply_markup=_menu_keyboard_for(_uid(query.from_user.id)))
+
+
+async def _cb_custom_platform(update: Update, context: ContextTypes.DEFAULT_TYPE, name: str) -> None:
+    await update.callback_query.edit_message_text(
+        f"'{name}' is one of your saved platforms. Scraping is not available for it yet.",
+        reply_markup=_back_keyboard(),
+    )
+
+
+class CallbackRouter:
+    """Dispatch table from callback_data to handler coroutines.
+
+    Exact routes are called as handler(update, context). Prefix routes match
+    callback_data of the form "<prefix>:<payload>" and are called as
+    handler(update, context, payload). Both lookups are single dict hits.
+    """
+
+    def __init__(self):
+        self._exact: Dict[str, Callable[..., Awaitable[None]]] = {}
+        self._prefix: Dict[str, Callable[..., Awaitable[None]]] = {}
+
+    def add(self, data: str, handler: Callable[..., Awaitable[None]]) -> None:
+        self._exact[data] = handler
+
+    def add_prefix(self, prefix: str, handler: Callable[..., Awaitable[None]]) -> None:
+        self._prefix[prefix] = handler
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE, data: Optional[str]) -> bool:
+        if not data:
+            return False
+        handler = self._exact.get(data)
+        if handler is not None:
+            await handler(update, context)
+            return True
+        prefix, sep, payload = data.partition(":")
+        handler = self._prefix.get(prefix) if sep else None
+        if handler is not None:
+            await handler(update, context, payload)
+            return True
+        return False
+
+
+def build_callback_router() -> CallbackRouter:
+    """Build the callback routes from PLATFORMS plus the fixed menu actions."""
+    router = CallbackRouter()
+    for platform in PLATFORMS.values():
+        router.add(platform.key, functools.partial(_cb_platform_menu, platform=platform))
+        router.add(f"{platform.key}_login", functools.partial(_cb_platform_login, platform=platform))
+        router.add(f"{platform.key}_fetch", functools.partial(_cb_platform_fetch, platform=platform))
+    router.add("add_platform", _cb_add_platform)
+    router.add("back", _cb_back)
+    router.add_prefix(_CUSTOM_CALLBACK_PREFIX, _cb_custom_platform)
+    return router
+
+
+_callback_router: Optional[CallbackRouter] = None
+
+
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle callback queries from inline keyboards."""
+    global _callback_router
     query = update.callback_query
     await query.answer()
-    data = query.data
-    user = query.from_user
-    key = _uid(user.id)
+    if not query.data:
+        # Game and some inline-mode callbacks carry no data; there is nothing to route
+        return
+    if _callback_router is None:
+        _callback_router = build_callback_router()
+    if not await _callback_router.dispatch(update, context, query.data):
+        logger.warning(f"No callback route for {query.data!r}")
 
-    if data == "tiktok":
-        keyboard = [
-            [InlineKeyboardButton("Login to TikTok", callback_data="tiktok_login")],
-            [InlineKeyboardButton("Fetch User Info", callback_data="tiktok_fetch")],
-            [InlineKeyboardButton("Back", callback_data="back")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text("TikTok Options:", reply_markup=reply_markup)
-    elif data == "instagram":
-        keyboard = [
-            [InlineKeyboardButton("Login to Instagram", callback_data="instagram_login")],
-            [InlineKeyboardButton("Fetch User Info", callback_data="instagram_fetch")],
-            [InlineKeyboardButton("Back", callback_data="back")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text("Instagram Options:", reply_markup=reply_markup)
-    elif data == "facebook":
-        keyboard = [
-            [InlineKeyboardButton("Login to Facebook", callback_data="facebook_login")],
-            [InlineKeyboardButton("Fetch User Info", callback_data="facebook_fetch")],
-            [InlineKeyboardButton("Back", callback_data="back")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text("Facebook Options:", reply_markup=reply_markup)
-    elif data == "instagram_login":
-        await query.edit_message_text("Please reply with your Instagram access token.")
-        user_data.setdefault(key, {"email": None, "phone": None, "social_media": [], "tiktok_token": None, "instagram_token": None, "facebook_token": None, "fetched_data": {}, "awaiting_token": False, "awaiting_platform": False, "is_adding_platform": False})
-        user_data[key]["awaiting_token"] = True
-        user_data[key]["awaiting_platform"] = "instagram"
-        save_user_data(user_data)
-    elif data == "instagram_fetch":
-        if user_data.get(key, {}).get("instagram_token"):
-            # Simulate fetching Instagram user info
-            user_info = {
-                "user_id": "123456789",
-                "display_name": "John Doe",
-                "profile_picture_url": "https://example.com/pic.jpg",
-                "follower_count": 1000,
-                "following_count": 500,
-                "likes_count": 2000,
-                "video_count": 50,
-                "profile_description": "Bio here"
-            }
-            user_data[key]["fetched_data"]["instagram"] = user_info
-            save_user_data(user_data)
-            info_text = f"User ID: {user_info['user_id']}\nDisplay Name: {user_info['display_name']}\nProfile Picture: {user_info['profile_picture_url']}\nFollower Count: {user_info['follower_count']}\nFollowing Count: {user_info['following_count']}\nLikes Count: {user_info['likes_count']}\nVideo Count: {user_info['video_count']}\nProfile Description: {user_info['profile_description']}"
-            await query.edit_message_text(f"Fetched Instagram User Info:\n{info_text}")
-        else:
-            await query.edit_message_text("Please login to Instagram first.")
-    elif data == "facebook_login":
-        await query.edit_message_text("Please reply with your Facebook access token.")
-        user_data.setdefault(key, {"email": None, "phone": None, "social_media": [], "tiktok_token": None, "instagram_token": None, "facebook_token": None, "fetched_data": {}, "awaiting_token": False, "awaiting_platform": False, "is_adding_platform": False})
-        user_data[key]["awaiting_token"] = True
-        user_data[key]["awaiting_platform"] = "facebook"
-        save_user_data(user_data)
-    elif data == "facebook_fetch":
-        if user_data.get(key, {}).get("facebook_token"):
-            # Simulate fetching Facebook user info
-            user_info = {
-                "user_id": "987654321",
-                "display_name": "Jane Doe",
-                "profile_picture_url": "https://example.com/fbpic.jpg",
-                "friend_count": 500,
-                "follower_count": 2000,
-                "following_count": 300,
-                "likes_count": 1500,
-                "post_count": 100,
-                "profile_description": "About me"
-            }
-            user_data[key]["fetched_data"]["facebook"] = user_info
-            save_user_data(user_data)
-            info_text = f"User ID: {user_info['user_id']}\nDisplay Name: {user_info['display_name']}\nProfile Picture: {user_info['profile_picture_url']}\nFriend Count: {user_info['friend_count']}\nFollower Count: {user_info['follower_count']}\nFollowing Count: {user_info['following_count']}\nLikes Count: {user_info['likes_count']}\nPost Count: {user_info['post_count']}\nProfile Description: {user_info['profile_description']}"
-            await query.edit_message_text(f"Fetched Facebook User Info:\n{info_text}")
-        else:
-            await query.edit_message_text("Please login to Facebook first.")
-    elif data == "add_platform":
-        await query.edit_message_text("Please reply with the name of the new platform.")
-        user_data.setdefault(key, {"email": None, "phone": None, "social_media": [], "tiktok_token": None, "fetched_data": {}, "is_adding_platform": False, "awaiting_token": False})
-        user_data[key]["is_adding_platform"] = True
-        save_user_data(user_data)
-    elif data == "tiktok_login":
-        await query.edit_message_text("Please reply with your TikTok access token.")
-        user_data.setdefault(key, {"email": None, "phone": None, "social_media": [], "tiktok_token": None, "fetched_data": {}, "is_adding_platform": False, "awaiting_token": False})
-        user_data[key]["awaiting_token"] = True
-        save_user_data(user_data)
-    elif data == "tiktok_fetch":
-        if user_data.get(key, {}).get("tiktok_token"):
-            token = user_data[key]["tiktok_token"]
-            url = "https://open-api.tiktok.com/user/info/"
-            headers = {"Authorization": f"Bearer {token}"}
-            try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    resp = await client.get(url, headers=headers)
-                    if resp.status_code == 200:
-                        api_data = resp.json()
-                        user_info = api_data.get("data", {})
-                        user_data[key]["fetched_data"]["tiktok"] = user_info
-                        save_user_data(user_data)
-                        info_text = f"User ID: {user_info.get('user_id')}\nDisplay Name: {user_info.get('display_name')}\nProfile Picture: {user_info.get('avatar_url')}\nFollower Count: {user_info.get('follower_count')}\nFollowing Count: {user_info.get('following_count')}\nLikes Count: {user_info.get('likes_count')}\nVideo Count: {user_info.get('video_count')}\nProfile Description: {user_info.get('signature')}"
-                        await query.edit_message_text(f"Fetched TikTok User Info:\n{info_text}")
-                    else:
-                        await query.edit_message_text("Failed to fetch user info. Check token or API.")
-            except Exception as e:
-                await query.edit_message_text(f"Error fetching data: {str(e)}")
-        else:
-            await query.edit_message_text("Please login to TikTok first.")
-    elif data == "back":
-        keyboard = [
-            [InlineKeyboardButton("TikTok", callback_data="tiktok")],
-            [InlineKeyboardButton("Instagram", callback_data="instagram")],
-            [InlineKeyboardButton("Facebook", callback_data="facebook")],
-            [InlineKeyboardButton("Add New Platform", callback_data="add_platform")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text("Select a social media platform to interact with:", reply_markup=reply_markup)
 
+# TikTok username rules: 2-24 characters from a-z, 0-9, '_' and '.', not starting
+# or ending with a dot. Usernames are case-insensitive, so candidates are lowercase.
+TIKTOK_USERNAME_MIN_LEN = 2
+TIKTOK_USERNAME_MAX_LEN = 24
+_TIKTOK_USERNAME_CHARS = frozenset(string.ascii_lowercase + string.digits + "_.")
+
+
+def is_valid_tiktok_username(username: str) -> bool:
+    return (
+        TIKTOK_USERNAME_MIN_LEN <= len(username) <= TIKTOK_USERNAME_MAX_LEN
+        and set(username) <= _TIKTOK_USERNAME_CHARS
+        and not username.startswith(".")
+        and not username.endswith(".")
+    )
+
+
+class PatternExpansion:
+    """Lazy, de-duplicated expansion of a username pattern with at most one '*'.
+
+    Only candidates that satisfy the TikTok username rules are produced; the
+    per-position alphabets exclude anything invalid up front, so nothing is built
+    and then filtered away. `total` (and len()) is exact and computed without
+    generating a single candidate. `limit` caps iteration like itertools.islice.
+    """
+
+    def __init__(self, pattern: str, max_len: int = 2, charset: Optional[str] = None, limit: Optional[int] = None):
+        pattern = pattern[1:] if pattern.startswith("@") else pattern
+        self.pattern = pattern.lower()
+        self.max_len = max_len
+        # sorted, distinct and restricted to valid characters, so every product is unique
+        self.charset = "".join(sorted(set((charset or string.ascii_lowercase + string.digits).lower()) & _TIKTOK_USERNAME_CHARS))
+        self.limit = limit
+        self._parts = self.pattern.split("*")
+        self.total = self._count()
+
+    def _lengths(self) -> range:
+        """Wildcard lengths that keep the whole username within the length limits."""
+        prefix, suffix = self._parts
+        fixed = len(prefix) + len(suffix)
+        return range(max(1, TIKTOK_USERNAME_MIN_LEN - fixed), min(self.max_len, TIKTOK_USERNAME_MAX_LEN - fixed) + 1)
+
+    def _alphabets(self, length: int) -> List[str]:
+        prefix, suffix = self._parts
+        alphabets = [self.charset] * length
+        no_dot = self.charset.replace(".", "")
+        if not prefix:
+            alphabets[0] = no_dot
+        if not suffix:
+            alphabets[-1] = no_dot
+        return alphabets
+
+    def _fixed_parts_valid(self) -> bool:
+        prefix, suffix = self._parts
+        return (
+            set(prefix + suffix) <= _TIKTOK_USERNAME_CHARS
+            and not prefix.startswith(".")
+            and not suffix.endswith(".")
+        )
 
-def _expand_pattern(pattern: str, max_len: int = 2, charset: Optional[str] = None) -> List[str]:
+    def _count(self) -> int:
+        if len(self._parts) == 1:
+            return 1 if is_valid_tiktok_username(self.pattern) else 0
+        if len(self._parts) != 2 or not self._fixed_parts_valid():
+            # only a single '*' is supported
+            return 0
+        total = 0
+        for length in self._lengths():
+            combos = 1
+            for alphabet in self._alphabets(length):
+                combos *= len(alphabet)
+            total += combos
+        return total
+
+    def _generate(self) -> Iterator[str]:
+        if len(self._parts) == 1:
+            if self.total:
+                yield self.pattern
+            return
+        if not self.total:
+            return
+        prefix, suffix = self._parts
+        for length in self._lengths():
+            for comb in product(*self._alphabets(length)):
+                yield prefix + "".join(comb) + suffix
+
+    def __iter__(self) -> Iterator[str]:
+        return islice(self._generate(), self.limit)
+
+    def __len__(self) -> int:
+        return self.total if self.limit is None else min(self.total, self.limit)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+
+def _expand_pattern(pattern: str, max_len: int = 2, charset: Optional[str] = None,
+                    limit: Optional[int] = None) -> PatternExpansion:
     """Expand a simple pattern with a single '*' wildcard into candidate usernames.
 
     - pattern: e.g. 'foo*bar' or '@foo*'
     - max_len: maximum length to substitute for '*' (small number by default)
     - charset: characters to use for expansion (defaults to lowercase letters+digits)
+    - limit: yield at most this many candidates
 
-    Returns a list of username strings (without leading '@'). This function is intentionally
-    conservative: it limits expansions to avoid huge candidate sets.
+    Returns a lazy PatternExpansion of valid TikTok usernames (without leading '@');
+    len() gives the exact number of candidates it will yield.
     """
-    if charset is None:
-        charset = string.ascii_lowercase + string.digits
+    return PatternExpansion(pattern, max_len=max_len, charset=charset, limit=limit)
 
-    # strip leading @ if present
-    if pattern.startswith("@"):
-        pattern = pattern[1:]
 
-    if "*" not in pattern:
-        return [pattern]
+# Username existence results for /search and /probe. "Exists" answers stay valid
+# much longer than "not found" ones, since a free username can be taken any time.
+USERNAME_CACHE_DB = os.environ.get("USERNAME_CACHE_DB", "username_cache.db")
+USERNAME_CACHE_TTL_EXISTS = float(os.environ.get("USERNAME_CACHE_TTL_EXISTS", str(24 * 3600)))
+USERNAME_CACHE_TTL_MISSING = float(os.environ.get("USERNAME_CACHE_TTL_MISSING", "3600"))
+USERNAME_CACHE_SIZE = max(1, int(os.environ.get("USERNAME_CACHE_SIZE", "100000")))
 
-    parts = pattern.split("*")
-    if len(parts) != 2:
-        # only support single '*' for now
-        return []
 
-    prefix, suffix = parts
-    candidates: List[str] = []
-    # generate all combinations up to max_len
-    for L in range(1, max_len + 1):
-        for comb in product(charset, repeat=L):
-            mid = "".join(comb)
-            candidates.append(prefix + mid + suffix)
-    return candidates
+class UsernameExistenceCache:
+    """Which TikTok usernames exist, kept across searches and restarts.
+
+    Lookups are answered from an in-memory LRU (a TTLCache) that is filled from
+    SQLite on first use; new results go to both. Only definite answers are
+    stored: timeouts, 429s and server errors are probed again next time.
+    """
+
+    def __init__(self, path: str = USERNAME_CACHE_DB, ttl_exists: float = USERNAME_CACHE_TTL_EXISTS,
+                 ttl_missing: float = USERNAME_CACHE_TTL_MISSING, maxsize: int = USERNAME_CACHE_SIZE):
+        self.path = path
+        self.ttl_exists = ttl_exists
+        self.ttl_missing = ttl_missing
+        self.memory = TTLCache(maxsize)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loaded = False
+        # Created on first use, inside the running loop
+        self._load_lock: Optional[asyncio.Lock] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS username_exists ("
+                "username TEXT PRIMARY KEY, found INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS username_exists_expires ON username_exists (expires_at)")
+            self._conn = conn
+        return self._conn
+
+    def _load(self) -> List[tuple]:
+        # oldest first, so the LRU ends up evicting the entries closest to expiry
+        cur = self._connection().execute(
+            "SELECT username, found, expires_at FROM username_exists WHERE expires_at > ? "
+            "ORDER BY expires_at DESC LIMIT ?",
+            (time.time(), self.memory.maxsize),
+        )
+        return list(reversed(cur.fetchall()))
+
+    def _write(self, rows: List[tuple]) -> None:
+        conn = self._connection()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO username_exists (username, found, expires_at) VALUES (?, ?, ?)", rows)
+            conn.execute("DELETE FROM username_exists WHERE expires_at <= ?", (time.time(),))
+            (count,) = conn.execute("SELECT COUNT(*) FROM username_exists").fetchone()
+            if count > self.memory.maxsize:
+                conn.execute(
+                    "DELETE FROM username_exists WHERE username IN "
+                    "(SELECT username FROM username_exists ORDER BY expires_at LIMIT ?)",
+                    (count - self.memory.maxsize,),
+                )
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="username-cache")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        # Concurrent first callers wait for a single load instead of returning before
+        # the rows are in memory or reading the database twice
+        async with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                rows = await self._run(self._load)
+            except Exception as e:
+                logger.error(f"Error loading username cache: {e}")
+                rows = []
+            now = time.time()
+            for username, found, expires_at in rows:
+                self.memory.set(username, bool(found), expires_at - now)
+            self._loaded = True
+
+    def lookup(self, username: str) -> Optional[bool]:
+        """True/False when the answer is cached and fresh, None when it must be probed."""
+        return self.memory.get(username.lower())
+
+    async def store(self, results: Dict[str, bool]) -> None:
+        now = time.time()
+        rows = []
+        for username, found in results.items():
+            ttl = self.ttl_exists if found else self.ttl_missing
+            self.memory.set(username.lower(), found, ttl)
+            rows.append((username.lower(), int(found), now + ttl))
+        if not rows:
+            return
+        try:
+            await self._run(self._write, rows)
+        except Exception as e:
+            logger.error(f"Error saving username cache: {e}")
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
 
+username_cache = UsernameExistenceCache()
 
-async def _probe_usernames(usernames: List[str], concurrency: int = 5, timeout: float = 10.0) -> List[str]:
+
+async def _probe_usernames(usernames: Iterable[str], concurrency: int = 5, timeout: float = 10.0,
+                           progress: Optional[Callable[[int, int], None]] = None,
+                           cache: Optional[UsernameExistenceCache] = None) -> List[str]:
     """Probe tiktok.com/@username for existence. Returns list of usernames that exist.
 
     Uses httpx AsyncClient. A 200 response (and presence of username in HTML) is treated
     as the profile existing. This is a heuristic and may need adjustment.
+    `usernames` is consumed lazily by `concurrency` workers, so a PatternExpansion
+    never has more than `concurrency` candidates in flight. `progress(done, found)`
+    is called after every probe. With a `cache`, fresh cached answers are used as-is
+    and only the remaining candidates are requested.
     """
     found: List[str] = []
+    done = 0
     headers = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"}
 
-    async def _probe(client, username: str) -> None:
+    async def _probe(client, username: str) -> Optional[bool]:
+        """True/False when the profile page answered definitively, None otherwise."""
         url = f"https://www.tiktok.com/@{username}"
         try:
             r = await client.get(url, headers=headers, timeout=timeout)
-            if r.status_code == 200 and username.lower() in r.text.lower():
-                found.append(username)
         except Exception:
             # ignore errors for single probes; caller can log if desired
-            pass
-
-    async with httpx.AsyncClient() as client:
-        # run in batches with limited concurrency
-        sem = asyncio.Semaphore(concurrency)
-
-        async def sem_probe(u: str):
-            async with sem:
-                await _probe(client, u)
-
-        await asyncio.gather(*(sem_probe(u) for u in usernames))
+            return None
+        if r.status_code == 200:
+            return username.lower() in r.text.lower()
+        if r.status_code == 404:
+            return False
+        # rate limited or a server error: unknown, so not cached either
+        return None
+
+    if cache is not None:
+        await cache.ensure_loaded()
+    checked: Dict[str, bool] = {}
+    client = get_http_client("https://www.tiktok.com/")
+    pending = iter(usernames)
+
+    async def worker() -> None:
+        nonlocal done
+        # workers share one iterator; next() never yields to the loop, so each
+        # candidate is handed to exactly one worker
+        for u in pending:
+            exists = cache.lookup(u) if cache is not None else None
+            if exists is None:
+                exists = await _probe(client, u)
+                if exists is not None:
+                    checked[u] = exists
+            if exists:
+                found.append(u)
+            done += 1
+            if progress is not None:
+                progress(done, len(found))
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    if cache is not None:
+        await cache.store(checked)
 
     return found
 
@@ -816,7 +3251,7 @@ async def search_username(update, context) -> None:
       /search someprefix*      -> probe candidates where '*' is replaced by up to N chars
 
     The expansion is conservative to avoid excessive probing. Configure via env:
-      PROBE_MAX_LEN (default 2), PROBE_CONCURRENCY (default 5)
+      PROBE_MAX_LEN (default 2), PROBE_CONCURRENCY (default 5), PROBE_CANDIDATE_LIMIT (default 200)
     """
     user = update.effective_user
     key = _uid(user.id)
@@ -826,41 +3261,474 @@ async def search_username(update, context) -> None:
         return
 
     pattern = args[0]
-    max_len = int(os.environ.get("PROBE_MAX_LEN", "2"))
-    concurrency = int(os.environ.get("PROBE_CONCURRENCY", "5"))
+    settings = _settings_for(context)
+    max_len = settings.probe_max_len
+    concurrency = settings.probe_concurrency
 
-    await update.message.reply_text(f"Searching for pattern: {pattern} (this may take a few seconds)")
-
-    candidates = _expand_pattern(pattern, max_len=max_len)
+    # limit total candidates to a reasonable amount
+    candidates = _expand_pattern(pattern, max_len=max_len, limit=settings.probe_candidate_limit)
     if not candidates:
-        await update.message.reply_text("No candidates generated from pattern (only single '*' supported). Try a simpler pattern like foo* or @username.")
+        await update.message.reply_text(
+            "No candidates generated from pattern (only single '*' supported, and usernames must be "
+            "2-24 letters, digits, '_' or '.', not starting or ending with '.'). "
+            "Try a simpler pattern like foo* or @username."
+        )
         return
 
-    # limit total candidates to a reasonable amount
-    limit = int(os.environ.get("PROBE_CANDIDATE_LIMIT", "200"))
-    candidates = candidates[:limit]
-
-    found = await _probe_usernames(candidates, concurrency=concurrency)
-
-    # save results
-    user_data.setdefault(key, {"email": None, "phone": None, "social_media": []})
-    platform_store = user_data[key].setdefault("platform_data", {})
-    platform_store.setdefault("tiktok_candidates", {})
-    platform_store["tiktok_candidates"][pattern] = found
-    save_user_data(user_data)
-
-    if not found:
-        await update.message.reply_text("No matching TikTok usernames found for the provided pattern.")
-    else:
+    async def run(job: Job) -> str:
+        total = len(candidates)
+        found = await _probe_usernames(
+            candidates,
+            concurrency=concurrency,
+            cache=username_cache,
+            progress=lambda done, hits: job.report(f"Checked {done}/{total} candidates, {hits} found so far."),
+        )
+        # save results
+        await scrape_history.record(key, "tiktok_candidates", pattern, found)
+        checked = "" if candidates.total == total else f"\n(checked the first {total} of {candidates.total} candidates)"
+        if not found:
+            return "No matching TikTok usernames found for the provided pattern." + checked
         reply = "Found the following usernames:\n" + "\n".join(f"@{u}" for u in found[:10])
         if len(found) > 10:
             reply += f"\n(and {len(found)-10} more)"
-        await update.message.reply_text(reply)
+        return reply + checked
+
+    await job_manager.submit(update, key, "tiktok_candidates", pattern,
+                             f"Searching for pattern: {pattern} (this may take a few seconds)", run)
+
 
+# Update scheduling: updates from different users are processed concurrently,
+# updates from the same user strictly one after another in arrival order.
+UPDATE_CONCURRENCY = max(1, int(os.environ.get("UPDATE_CONCURRENCY", "32")))
+# Backlog cap of the update processor when the application polls; in webhook mode and
+# in sharded workers the update queue size is used (see build_update_processor)
+UPDATE_MAX_PENDING = max(1, int(os.environ.get("UPDATE_MAX_PENDING", "1000")))
 
-def build_application(token: str):
-    """Create and return a telegram Application instance."""
-    app = ApplicationBuilder().token(token).build()
+
+class PerUserScheduler:
+    """Run update coroutines concurrently across users but serially per user.
+
+    Each user has a FIFO lock, so handle_text's email -> phone -> token steps never
+    interleave. At most `max_concurrent` updates run at once overall. An update
+    only takes one of those slots after it holds its user's lock, so a user with a
+    backlog of slow scrapes cannot occupy the whole pool.
+    """
+
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._locks: Dict[Any, asyncio.Lock] = {}
+        # updates per key that are waiting or running; the lock is dropped at zero
+        self._pending: Dict[Any, int] = {}
+        self.active = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.processed = 0
+
+    async def run(self, key: Any, coroutine: Awaitable[Any]) -> None:
+        """Await `coroutine` once no other update for `key` is running. key=None skips the per-user lock."""
+        lock = None
+        if key is not None:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = asyncio.Lock()
+            self._pending[key] = self._pending.get(key, 0) + 1
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        queued_at = time.perf_counter()
+        started = False
+        try:
+            if lock is not None:
+                await lock.acquire()
+            try:
+                async with self._semaphore:
+                    self.queued -= 1
+                    self.active += 1
+                    started = True
+                    try:
+                        with trace_span("dispatch", waited_ms=round((time.perf_counter() - queued_at) * 1000, 2)):
+                            await coroutine
+                    finally:
+                        self.active -= 1
+                        self.processed += 1
+            finally:
+                if lock is not None:
+                    lock.release()
+        finally:
+            if not started:
+                # cancelled while waiting: the handler never ran
+                self.queued -= 1
+                coroutine.close()
+            if key is not None:
+                left = self._pending[key] - 1
+                if left:
+                    self._pending[key] = left
+                else:
+                    del self._pending[key]
+                    del self._locks[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "users": len(self._pending),
+            "deepest_user_queue": max(self._pending.values(), default=0),
+            "processed": self.processed,
+        }
+
+
+update_scheduler = PerUserScheduler(UPDATE_CONCURRENCY)
+metrics.gauge("krisbot_updates_running", "Updates currently being handled.", lambda: update_scheduler.active)
+metrics.gauge("krisbot_updates_queued", "Updates waiting for their user's lock or a free slot.",
+              lambda: update_scheduler.queued)
+
+
+def _update_key(update: Any) -> Optional[int]:
+    """Serialization key for an update: the user, else the chat, else None (no ordering)."""
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, "effective_chat", None)
+    return chat.id if chat is not None else None
+
+
+def build_update_processor(scheduler: PerUserScheduler, max_pending: int = UPDATE_MAX_PENDING):
+    """Wrap `scheduler` in a telegram BaseUpdateProcessor for ApplicationBuilder.concurrent_updates.
+
+    With concurrent updates the application starts a task for every update it takes
+    off update_queue, so a bounded queue alone never pushes back. Code that feeds
+    update_queue itself (webhook_server.py, supervisor.py workers) therefore calls
+    admit() / wait_admit() first; an admitted update holds its place until it has
+    been fully processed, which caps the whole backlog at `max_pending`.
+    """
+    from telegram.ext import BaseUpdateProcessor
+
+    class PerUserUpdateProcessor(BaseUpdateProcessor):
+        def __init__(self):
+            # The base class takes this semaphore before do_process_update, i.e. before
+            # the per-user lock. Sized to the backlog cap it never holds back another
+            # user's update; the scheduler enforces the real concurrency limit.
+            super().__init__(max(max_pending, scheduler.max_concurrent))
+            self.max_pending = max_pending
+            # Admissions not finished yet, by update_id. A count, since Telegram may
+            # redeliver an update that is still pending here and each copy holds a place.
+            self._admitted: Dict[int, int] = {}
+            self._pending = 0
+            self._room = asyncio.Event()
+
+        @property
+        def admitted(self) -> int:
+            return self._pending
+
+        def admit(self, update) -> bool:
+            """Reserve a place for `update` before it is queued; False when the backlog is full."""
+            if self._pending >= self.max_pending:
+                return False
+            self._admitted[update.update_id] = self._admitted.get(update.update_id, 0) + 1
+            self._pending += 1
+            return True
+
+        async def wait_admit(self, update) -> None:
+            while not self.admit(update):
+                self._room.clear()
+                await self._room.wait()
+
+        def release(self, update) -> None:
+            """Give up the place of an admitted update (finished, or never queued).
+
+            A no-op for updates that were never admitted (e.g. fetched by polling).
+            """
+            update_id = getattr(update, "update_id", None)
+            count = self._admitted.get(update_id)
+            if not count:
+                return
+            if count == 1:
+                del self._admitted[update_id]
+            else:
+                self._admitted[update_id] = count - 1
+            self._pending -= 1
+            self._room.set()
+
+        async def do_process_update(self, update, coroutine) -> None:
+            # The scheduler takes the per-user lock first and then a running slot
+            try:
+                key = _update_key(update)
+                slow_ms = get_settings().trace_slow_ms
+                if slow_ms:
+                    attrs = {"update_id": getattr(update, "update_id", None), "user": key}
+                    await run_traced("update", attrs, scheduler.run(key, coroutine), slow_ms)
+                else:
+                    await scheduler.run(key, coroutine)
+            finally:
+                self.release(update)
+
+        async def initialize(self) -> None:
+            pass
+
+        async def shutdown(self) -> None:
+            pass
+
+    return PerUserUpdateProcessor()
+
+
+# Outbound pacing for Bot API calls that target a chat, following Telegram's
+# documented limits: ~30 messages/s overall, ~1/s per private chat (short bursts
+# are tolerated) and 20/min per group.
+SEND_GLOBAL_RATE = float(os.environ.get("SEND_GLOBAL_RATE", "30"))
+SEND_CHAT_RATE = float(os.environ.get("SEND_CHAT_RATE", "1.0"))
+SEND_CHAT_BURST = max(1, int(os.environ.get("SEND_CHAT_BURST", "3")))
+SEND_GROUP_RATE_PER_MIN = float(os.environ.get("SEND_GROUP_RATE_PER_MIN", "20"))
+SEND_MAX_RETRIES = max(0, int(os.environ.get("SEND_MAX_RETRIES", "3")))
+# Per-chat buckets kept (LRU); an evicted chat simply starts with a full bucket
+SEND_MAX_TRACKED_CHATS = max(1, int(os.environ.get("SEND_MAX_TRACKED_CHATS", "10000")))
+
+
+class TokenBucket:
+    """Reservation-style token bucket: reserve() returns how long to wait for the slot."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def pause(self, seconds: float) -> None:
+        """Push every future reservation back by at least `seconds` (after a 429)."""
+        self.reserve()
+        self.tokens = min(self.tokens + 1, 0) - seconds * self.rate
+
+
+class SendPacer:
+    """Per-chat and global token buckets plus bookkeeping for merging message edits."""
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, chat_rate: float = SEND_CHAT_RATE,
+                 chat_burst: int = SEND_CHAT_BURST, group_rate_per_min: float = SEND_GROUP_RATE_PER_MIN,
+                 max_chats: int = SEND_MAX_TRACKED_CHATS):
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate_per_min / 60.0
+        self.group_burst = max(1.0, group_rate_per_min)
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+        # newest sequence number per (chat_id, message_id) with an edit in flight
+        self._edits: Dict[Tuple[Any, Any], int] = {}
+        # set when the edit holding the reserved slot for a message reaches it
+        self._edit_slots: Dict[Tuple[Any, Any], asyncio.Event] = {}
+        self._edit_seq = 0
+        self.sent = 0
+        self.delayed = 0
+        self.merged = 0
+        self.retried = 0
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # negative ids are groups/channels, positive ones private chats
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def wait(self, chat_id: Any) -> None:
+        """Sleep until both the chat's and the global budget allow one more call."""
+        waited = False
+        for bucket in (self._chat_bucket(chat_id), self.global_bucket):
+            delay = bucket.reserve()
+            if delay > 0:
+                waited = True
+                await asyncio.sleep(delay)
+        if waited:
+            self.delayed += 1
+
+    def pause(self, chat_id: Any, seconds: float) -> None:
+        self._chat_bucket(chat_id).pause(seconds)
+        self.retried += 1
+
+    def begin_edit(self, key: Tuple[Any, Any]) -> int:
+        self._edit_seq += 1
+        self._edits[key] = self._edit_seq
+        return self._edit_seq
+
+    def superseded(self, key: Tuple[Any, Any], seq: int) -> bool:
+        """True when a newer edit of the same message was queued while this one waited."""
+        return self._edits.get(key, seq) != seq
+
+    def end_edit(self, key: Tuple[Any, Any], seq: int) -> None:
+        if self._edits.get(key) == seq:
+            del self._edits[key]
+
+    def edit_slot(self, key: Tuple[Any, Any]) -> Optional[asyncio.Event]:
+        """The pending slot of an older edit of the same message, if one is waiting for it."""
+        return self._edit_slots.get(key)
+
+    def hold_edit_slot(self, key: Tuple[Any, Any]) -> asyncio.Event:
+        slot = self._edit_slots[key] = asyncio.Event()
+        return slot
+
+    def release_edit_slot(self, key: Tuple[Any, Any], slot: asyncio.Event) -> None:
+        """The holder reached its slot: newer edits that waited for it may use it now."""
+        if self._edit_slots.get(key) is slot:
+            del self._edit_slots[key]
+        slot.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {"sent": self.sent, "delayed": self.delayed, "merged": self.merged,
+                "retried": self.retried, "chats": len(self._chats)}
+
+
+send_pacer = SendPacer()
+
+
+def _retry_after_seconds(error: Any) -> float:
+    retry_after = error.retry_after
+    # an int in older python-telegram-bot releases, a timedelta in newer ones
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+
+def build_rate_limiter(pacer: SendPacer, max_retries: int = SEND_MAX_RETRIES):
+    """Wrap `pacer` in a telegram BaseRateLimiter for ApplicationBuilder.rate_limiter."""
+    from telegram.error import RetryAfter
+    from telegram.ext import BaseRateLimiter
+
+    class PacedRateLimiter(BaseRateLimiter):
+        async def initialize(self) -> None:
+            pass
+
+        async def shutdown(self) -> None:
+            pass
+
+        async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+            with trace_span("bot_api", endpoint=endpoint):
+                return await self._paced(callback, args, kwargs, endpoint, data)
+
+        async def _paced(self, callback, args, kwargs, endpoint, data):
+            chat_id = data.get("chat_id")
+            if chat_id is None:
+                # getUpdates, answerCallbackQuery, inline edits, ... are not paced
+                return await callback(*args, **kwargs)
+
+            edit_key = None
+            reserved = False
+            if endpoint == "editMessageText" and data.get("message_id") is not None:
+                edit_key = (chat_id, data["message_id"])
+                seq = pacer.begin_edit(edit_key)
+            try:
+                if edit_key is not None:
+                    # Only the oldest pending edit of a message reserves a send slot; newer
+                    # edits wait for that slot and the newest one is sent in it, so merged
+                    # edits never spend budget or make the final text wait longer.
+                    slot = pacer.edit_slot(edit_key)
+                    if slot is None:
+                        slot = pacer.hold_edit_slot(edit_key)
+                        try:
+                            await pacer.wait(chat_id)
+                        finally:
+                            pacer.release_edit_slot(edit_key, slot)
+                    else:
+                        await slot.wait()
+                    reserved = True
+                for attempt in range(max_retries + 1):
+                    if not reserved:
+                        await pacer.wait(chat_id)
+                    reserved = False
+                    if edit_key is not None and pacer.superseded(edit_key, seq):
+                        # A newer text for the same message is queued; this one would be
+                        # overwritten immediately, so report success without sending it.
+                        pacer.merged += 1
+                        return True
+                    try:
+                        result = await callback(*args, **kwargs)
+                    except RetryAfter as e:
+                        if attempt == max_retries:
+                            raise
+                        delay = _retry_after_seconds(e)
+                        logger.warning("Flood control on %s for chat %s, retrying in %.1fs", endpoint, chat_id, delay)
+                        pacer.pause(chat_id, delay)
+                        continue
+                    pacer.sent += 1
+                    return result
+            finally:
+                if edit_key is not None:
+                    pacer.end_edit(edit_key, seq)
+
+    return PacedRateLimiter()
+
+
+async def _post_init(application) -> None:
+    application.bot_data["settings"] = get_settings()
+    await load_user_data_async()
+    await _start_user_data_writer(application)
+    await job_manager.start()
+    global _metrics_server
+    if METRICS_PORT and _metrics_server is None:
+        _metrics_server = MetricsServer(metrics)
+        await _metrics_server.start()
+
+
+async def _post_stop(application) -> None:
+    # While the bot can still send: deliver results in flight, mark the rest interrupted
+    await job_manager.stop()
+
+
+async def _post_shutdown(application) -> None:
+    global _metrics_server
+    if _metrics_server is not None:
+        await _metrics_server.stop()
+        _metrics_server = None
+    await job_manager.stop()  # no-op after _post_stop; harnesses may skip that hook
+    await _stop_user_data_writer(application)
+    await close_http_clients()
+    scrape_history.close()
+    username_cache.close()
+
+
+def build_application(token: str, update_queue_size: Optional[int] = None, request=None):
+    """Create and return a telegram Application instance.
+
+    With `update_queue_size` the application gets a bounded update queue and no
+    updater: updates are pushed in by webhook_server.py instead of polled. The same
+    number caps the updates admitted but not yet processed (see build_update_processor).
+    `request` replaces the HTTP transport of the Bot (bench_handlers.py passes a fake).
+    """
+    from telegram.ext import ApplicationBuilder, CallbackQueryHandler, CommandHandler, MessageHandler, filters
+
+    global _http_clients, _callback_router
+    _http_clients = HttpClientRegistry()
+    _callback_router = build_callback_router()
+    warm_keyboard_cache()
+
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .post_init(_post_init)
+        .post_stop(_post_stop)
+        .post_shutdown(_post_shutdown)
+        .concurrent_updates(build_update_processor(update_scheduler, update_queue_size or UPDATE_MAX_PENDING))
+        .rate_limiter(build_rate_limiter(send_pacer))
+    )
+    if update_queue_size is not None:
+        builder = builder.updater(None).update_queue(asyncio.Queue(maxsize=update_queue_size))
+    if request is not None:
+        builder = builder.request(request)
+    app = builder.build()
 
     # Register command handlers
     app.add_handler(CommandHandler("start", start))
@@ -871,6 +3739,11 @@ def build_application(token: str):
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("search", search_username))
     app.add_handler(CommandHandler("scrape_link", scrape_link))
+    app.add_handler(CommandHandler("cachestats", cache_stats))
+    app.add_handler(CommandHandler("history", show_history))
+    app.add_handler(CommandHandler("reload_config", reload_config))
+    app.add_handler(CommandHandler("cancel", cancel_job))
+    app.add_handler(CommandHandler("job", show_job))
 
     # Also accept plain URLs sent as messages
     app.add_handler(MessageHandler(filters.Regex(r"https?://") & ~filters.COMMAND, scrape_link))
@@ -881,6 +3754,11 @@ def build_application(token: str):
     # Register message handler for text messages
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
 
+    # Count and time every handler registered above
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            handler.callback = _instrumented(_handler_label(handler), handler.callback)
+
     return app
 
 
@@ -900,6 +3778,34 @@ def main() -> None:
         )
         return
 
+    try:
+        get_settings()
+    except ValueError as e:
+        logger.error("Invalid configuration: %s", e)
+        print(f"Invalid configuration: {e}")
+        return
+
+    mode = os.environ.get("BOT_MODE", "polling").strip().lower()
+    if mode == "webhook":
+        from webhook_server import WEBHOOK_QUEUE_SIZE, run_webhook
+
+        app = build_application(token, update_queue_size=WEBHOOK_QUEUE_SIZE)
+        try:
+            run_webhook(app)
+        except ValueError as e:
+            logger.error("Cannot start webhook mode: %s", e)
+            print(f"Cannot start webhook mode: {e}")
+        except Exception:
+            logger.exception("Unhandled exception while running the bot")
+        finally:
+            flush_user_data()
+        return
+    if mode != "polling":
+        logger.error("BOT_MODE must be 'polling' or 'webhook', got %r", mode)
+        return
+
+    from telegram.error import Conflict
+
     app = build_application(token)
     # Start the bot (this will block until interrupted)
     try:
@@ -911,6 +3817,10 @@ def main() -> None:
         print("Conflict: another getUpdates request is active. Stop other instances or delete any webhook for this bot token and retry.")
     except Exception:
         logger.exception("Unhandled exception while running the bot")
+    finally:
+        # run_polling already flushes via post_shutdown on SIGINT/SIGTERM; this
+        # catches anything left if the loop died before shutdown hooks ran.
+        flush_user_data()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""End-to-end handler benchmark for KrisBot.
+
+Simulates many concurrent users. Each user sends a realistic update stream:
+/start, email and phone onboarding through handle_text, button presses into
+handle_callback (platform menu -> login -> token -> fetch -> back), /tiktok and a
+pasted profile link for scrape_link. Updates go through the real
+build_application() dispatcher and update processor. The Bot is backed by a fake
+request object that records every API call and answers without network access.
+MOCK_MODE is forced on and all state files live in a temporary directory.
+
+Reports p50/p95/p99 latency per update kind, throughput, Bot API calls and peak RSS.
+The run fails unless every /tiktok and pasted link ended in a delivered job result.
+--save-baseline writes the numbers as JSON; --baseline compares a run against such a
+file and exits 1 if p95 latency or throughput regressed by more than --tolerance.
+Without a path both use the committed bench_baseline.json next to this script.
+
+Usage:
+  python3 bench_handlers.py --users 200
+  python3 bench_handlers.py --users 200 --baseline --tolerance 0.2
+  python3 bench_handlers.py --users 200 --save-baseline        # refresh bench_baseline.json
+  python3 bench_handlers.py --users 200 --save-baseline bench_results/local.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_TOKEN = "123456:BENCHMARK-TOKEN"
+# Reference numbers committed with the repo (200 users, 1 round)
+BENCH_BASELINE = os.path.join(REPO_DIR, "bench_baseline.json")
+
+
+def _prepare_environment(workdir: str, pacing: bool) -> None:
+    """Must run before KrisBot is imported: its module-level settings read the environment."""
+    os.environ["MOCK_MODE"] = "1"
+    os.environ.setdefault("TIKTOK_MOCK_COUNT", "5")
+    if not pacing:
+        # Measure the handlers, not Telegram's flood limits
+        os.environ["SEND_GLOBAL_RATE"] = "1e9"
+        os.environ["SEND_CHAT_RATE"] = "1e9"
+        os.environ["SEND_CHAT_BURST"] = "1000000"
+        os.environ["SEND_GROUP_RATE_PER_MIN"] = "1e9"
+    # Every /tiktok and link must become a job, or the run measures "busy" replies
+    os.environ.setdefault("JOB_MAX_PENDING", "1000000")
+    os.environ.setdefault("JOB_MAX_PER_USER", "1000000")
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+
+
+def _make_request_class():
+    from telegram.request import BaseRequest
+
+    class RecordingRequest(BaseRequest):
+        """Answers Bot API calls locally and counts them by endpoint."""
+
+        def __init__(self):
+            self.calls: Counter = Counter()
+            self._message_ids = itertools.count(1_000_000)
+            # Status messages of background jobs, and those edited with the job's result
+            self.job_messages: Set[int] = set()
+            self.job_results: Set[int] = set()
+
+        @property
+        def read_timeout(self) -> Optional[float]:
+            return None
+
+        async def initialize(self) -> None:
+            pass
+
+        async def shutdown(self) -> None:
+            pass
+
+        def _result(self, endpoint: str, params: Dict[str, Any]) -> Any:
+            if endpoint == "getMe":
+                return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+                        "can_join_groups": False, "can_read_all_group_messages": False,
+                        "supports_inline_queries": False}
+            if endpoint in ("sendMessage", "editMessageText"):
+                chat_id = params.get("chat_id", 0)
+                message_id = int(params.get("message_id") or next(self._message_ids))
+                # Job status messages end with "send /cancel <id>"; the final edit replaces that
+                if "send /cancel " in str(params.get("text", "")):
+                    if endpoint == "sendMessage":
+                        self.job_messages.add(message_id)
+                elif endpoint == "editMessageText" and message_id in self.job_messages:
+                    self.job_results.add(message_id)
+                return {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": {"id": 1, "is_bot": True, "first_name": "Bench"},
+                    "text": params.get("text", ""),
+                }
+            return True
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None,
+                             write_timeout=None, connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+            endpoint = url.rsplit("/", 1)[-1]
+            params = request_data.parameters if request_data is not None else {}
+            self.calls[endpoint] += 1
+            return 200, json.dumps({"ok": True, "result": self._result(endpoint, params)}).encode("utf-8")
+
+    return RecordingRequest
+
+
+class UpdateFactory:
+    """Builds the JSON form of Telegram updates for one synthetic user."""
+
+    _update_ids = itertools.count(1)
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"Bench{user_id}"}
+        self.chat = {"id": user_id, "type": "private", "first_name": f"Bench{user_id}"}
+        self._message_ids = itertools.count(1)
+
+    def message(self, text: str) -> Dict[str, Any]:
+        msg = {"message_id": next(self._message_ids), "date": int(time.time()), "chat": self.chat,
+               "from": self.user, "text": text}
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self._update_ids), "message": msg}
+
+    def callback(self, data: str) -> Dict[str, Any]:
+        bot_msg = {"message_id": next(self._message_ids), "date": int(time.time()), "chat": self.chat,
+                   "from": {"id": 1, "is_bot": True, "first_name": "Bench"}, "text": "menu"}
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {"id": str(next(self._update_ids)), "from": self.user, "chat_instance": str(self.user_id),
+                               "message": bot_msg, "data": data},
+        }
+
+
+def user_script(user_id: int, rounds: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """(kind, update JSON) pairs one synthetic user sends, in order."""
+    f = UpdateFactory(user_id)
+    steps = [
+        ("start", f.message("/start")),
+        ("email", f.message(f"bench{user_id}@example.com")),
+        ("phone", f.message(f"+1555{user_id:07d}")),
+    ]
+    for r in range(rounds):
+        steps += [
+            ("callback", f.callback("instagram")),
+            ("callback", f.callback("instagram_login")),
+            ("token", f.message(f"token-{user_id}-{r}")),
+            ("callback", f.callback("instagram_fetch")),
+            ("callback", f.callback("back")),
+            ("tiktok", f.message("/tiktok")),
+            ("scrape_link", f.message(f"https://www.instagram.com/bench{user_id}_{r}/")),
+        ]
+    return steps
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if len(samples) < 2:
+        value = samples[0] * 1000 if samples else 0.0
+        return {"p50_ms": value, "p95_ms": value, "p99_ms": value}
+    q = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50_ms": q[49] * 1000, "p95_ms": q[94] * 1000, "p99_ms": q[98] * 1000}
+
+
+async def run_bench(users: int, rounds: int, concurrency: int) -> Dict[str, Any]:
+    import KrisBot
+    from telegram import Update
+
+    request = _make_request_class()()
+    app = KrisBot.build_application(BENCH_TOKEN, update_queue_size=1, request=request)
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    gate = asyncio.Semaphore(concurrency)
+
+    async def simulate(user_id: int) -> None:
+        async with gate:
+            for kind, data in user_script(user_id, rounds):
+                update = Update.de_json(data, app.bot)
+                started = time.perf_counter()
+                # What Application's update fetcher does for every update
+                await app.update_processor.process_update(update, app.process_update(update))
+                latencies[kind].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate(100_000 + i) for i in range(users)))
+    handlers_done = time.perf_counter() - started
+    # Background scrape jobs finish after their handler returned
+    await KrisBot.job_manager.drain()
+    elapsed = time.perf_counter() - started
+
+    jobs = len(latencies["tiktok"]) + len(latencies["scrape_link"])
+    if len(request.job_messages) != jobs or len(request.job_results) != jobs:
+        raise RuntimeError(f"{jobs} jobs submitted, {len(request.job_messages)} accepted, "
+                           f"{len(request.job_results)} results delivered")
+
+    if app.post_stop:
+        await app.post_stop(app)
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+    await app.shutdown()
+
+    all_samples = [s for samples in latencies.values() for s in samples]
+    return {
+        "users": users,
+        "rounds": rounds,
+        "updates": len(all_samples),
+        "elapsed_s": elapsed,
+        "handler_elapsed_s": handlers_done,
+        "throughput_updates_per_s": len(all_samples) / handlers_done if handlers_done else 0.0,
+        "latency": _percentiles(all_samples),
+        "latency_by_kind": {kind: _percentiles(samples) for kind, samples in sorted(latencies.items())},
+        "jobs": jobs,
+        "bot_api_calls": dict(request.calls),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    lat = result["latency"]
+    print(f"{result['updates']} updates from {result['users']} users in {result['handler_elapsed_s']:.2f}s "
+          f"({result['throughput_updates_per_s']:.0f} updates/s); background jobs drained after {result['elapsed_s']:.2f}s")
+    print(f"latency (all): p50 {lat['p50_ms']:.2f} ms  p95 {lat['p95_ms']:.2f} ms  p99 {lat['p99_ms']:.2f} ms")
+    for kind, q in result["latency_by_kind"].items():
+        print(f"  {kind:<12} p50 {q['p50_ms']:8.2f} ms  p95 {q['p95_ms']:8.2f} ms  p99 {q['p99_ms']:8.2f} ms")
+    calls = ", ".join(f"{k}={v}" for k, v in sorted(result["bot_api_calls"].items()))
+    print(f"Bot API calls: {calls}; {result.get('jobs', 0)} job results delivered")
+    print(f"peak RSS: {result['peak_rss_mb']:.1f} MB")
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """Print the change against `baseline`; False if a regression exceeds `tolerance`."""
+    ok = True
+    checks = [
+        ("p95 latency", result["latency"]["p95_ms"], baseline["latency"]["p95_ms"], True),
+        ("p99 latency", result["latency"]["p99_ms"], baseline["latency"]["p99_ms"], True),
+        ("throughput", result["throughput_updates_per_s"], baseline["throughput_updates_per_s"], False),
+        ("peak RSS", result["peak_rss_mb"], baseline["peak_rss_mb"], True),
+    ]
+    print("vs baseline:")
+    for name, now, before, lower_is_better in checks:
+        change = (now - before) / before if before else 0.0
+        worse = change > tolerance if lower_is_better else change < -tolerance
+        # p99 and RSS are too noisy to gate on; they are reported only
+        gated = name in ("p95 latency", "throughput")
+        flag = "REGRESSION" if worse and gated else ("worse" if worse else "ok")
+        print(f"  {name:<12} {before:10.2f} -> {now:10.2f}  ({change:+.1%})  {flag}")
+        if worse and gated:
+            ok = False
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=1, help="menu/scrape rounds per user after onboarding")
+    parser.add_argument("--concurrency", type=int, default=0, help="users active at once (default: all)")
+    parser.add_argument("--pacing", action="store_true", help="keep Telegram send pacing enabled")
+    parser.add_argument("--save-baseline", metavar="PATH", nargs="?", const=BENCH_BASELINE)
+    parser.add_argument("--baseline", metavar="PATH", nargs="?", const=BENCH_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (default 0.2)")
+    args = parser.parse_args()
+
+    save_path = os.path.abspath(args.save_baseline) if args.save_baseline else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    with tempfile.TemporaryDirectory(prefix="krisbot-bench-") as workdir:
+        _prepare_environment(workdir, args.pacing)
+        result = asyncio.run(run_bench(args.users, args.rounds, args.concurrency or args.users))
+
+    print_report(result)
+    if save_path:
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        with open(save_path, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"baseline saved to {save_path}")
+    if baseline_path:
+        with open(baseline_path, "r") as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
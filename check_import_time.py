@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Import-time budget check for KrisBot.
+
+Runs `python -X importtime -c "import KrisBot"` in a fresh interpreter and fails
+if the cumulative import time of the module exceeds the budget. Meant to be run
+from CI so heavy imports (telegram, httpx, faker) do not creep back to module level;
+test_import_time.py runs the same check as part of the test suite.
+
+Usage:
+  python3 check_import_time.py              # budget from IMPORT_TIME_BUDGET_MS (default 300)
+  python3 check_import_time.py --budget-ms 200 --runs 5 --top 15
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+
+def measure(module: str) -> Tuple[int, List[Tuple[int, str]]]:
+    """Return (cumulative microseconds for `module`, [(self_us, name), ...]) for one fresh import."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"import {module} failed")
+    cumulative = None
+    entries: List[Tuple[int, str]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        entries.append((int(self_us), name))
+        if name == module:
+            cumulative = int(cum_us)
+    if cumulative is None:
+        raise SystemExit(f"{module} not found in -X importtime output")
+    return cumulative, entries
+
+
+def best_of(module: str, runs: int) -> Tuple[int, List[Tuple[int, str]]]:
+    """measure() `runs` times and return the fastest run, to reduce noise."""
+    best = None
+    best_entries: List[Tuple[int, str]] = []
+    for _ in range(max(1, runs)):
+        cumulative, entries = measure(module)
+        if best is None or cumulative < best:
+            best, best_entries = cumulative, entries
+    return best, best_entries
+
+
+def default_budget_ms() -> float:
+    return float(os.environ.get("IMPORT_TIME_BUDGET_MS", "300"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="KrisBot")
+    parser.add_argument("--budget-ms", type=float, default=default_budget_ms())
+    parser.add_argument("--runs", type=int, default=3, help="take the best of N runs to reduce noise")
+    parser.add_argument("--top", type=int, default=10, help="show the N slowest imports")
+    args = parser.parse_args()
+
+    best, best_entries = best_of(args.module, args.runs)
+
+    by_name: Dict[str, int] = {}
+    for self_us, name in best_entries:
+        by_name[name.strip()] = by_name.get(name.strip(), 0) + self_us
+    print(f"Slowest imports (self time) for {args.module}:")
+    for name, self_us in sorted(by_name.items(), key=lambda kv: kv[1], reverse=True)[: args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    total_ms = best / 1000
+    print(f"import {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if total_ms > args.budget_ms:
+        print("FAIL: import time budget exceeded")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""Local stand-in for forestapi and the configurable scrape APIs.
+
+Serves the payload shapes KrisBot expects, so pooling, caching, retries and timeouts
+can be exercised and benchmarked without network access:
+
+  GET  /api/tiktok/user/{username}     forestapi TikTok profile  {"user": {...}, "stats": {...}}
+  GET  /api/instagram/user/{username}  forestapi Instagram profile
+  POST /tiktok/search                  TIKTOK_API_URL     {"email","phone"} -> {"accounts": [...]}
+  POST /instagram/scrape               INSTAGRAM_API_URL  {"url"} -> {"accounts": [...]}
+  GET  /_config  POST /_config         read / change fault settings at runtime (JSON)
+  GET  /_stats   POST /_stats/reset    request counts by route and status
+
+Profile GETs carry an ETag and Last-Modified and answer conditional requests with
+304, like the real API behind the disk response cache. Payloads are derived from
+the username, so repeated runs return identical bodies.
+
+Fault settings (env at startup, or POST /_config later):
+  FAKE_LATENCY_MS          mean added latency (default 50)
+  FAKE_LATENCY_DIST        fixed | uniform | exponential | lognormal (default exponential)
+  FAKE_LATENCY_MAX_MS      upper clamp for sampled latency (default 5000)
+  FAKE_ERROR_RATE          fraction of requests answered with 500 (default 0)
+  FAKE_RATE_LIMIT_RATE     fraction answered with 429 + Retry-After (default 0)
+  FAKE_RETRY_AFTER         Retry-After seconds on 429 (default 1)
+  FAKE_BODY_KB             padding added to each JSON body, in KiB (default 0)
+  FAKE_ACCOUNTS            accounts returned by the POST endpoints (default 3)
+  FAKE_SEED                seed for latency / fault sampling (default 1234)
+
+Usage:
+  python3 fake_upstream.py --port 8081
+  FORESTAPI_BASE_URL=http://127.0.0.1:8081 \\
+  TIKTOK_API_URL=http://127.0.0.1:8081/tiktok/search \\
+  INSTAGRAM_API_URL=http://127.0.0.1:8081/instagram/scrape python3 test_server.py
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+from collections import Counter
+from email.utils import formatdate
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request, Response
+from pydantic import BaseModel
+
+# Fixed so that Last-Modified validators stay stable across restarts
+_LAST_MODIFIED = formatdate(1_700_000_000, usegmt=True)
+
+config: Dict[str, Any] = {
+    "latency_ms": float(os.environ.get("FAKE_LATENCY_MS", "50")),
+    "latency_dist": os.environ.get("FAKE_LATENCY_DIST", "exponential"),
+    "latency_max_ms": float(os.environ.get("FAKE_LATENCY_MAX_MS", "5000")),
+    "error_rate": float(os.environ.get("FAKE_ERROR_RATE", "0")),
+    "rate_limit_rate": float(os.environ.get("FAKE_RATE_LIMIT_RATE", "0")),
+    "retry_after": int(os.environ.get("FAKE_RETRY_AFTER", "1")),
+    "body_kb": int(os.environ.get("FAKE_BODY_KB", "0")),
+    "accounts": int(os.environ.get("FAKE_ACCOUNTS", "3")),
+    "seed": int(os.environ.get("FAKE_SEED", "1234")),
+}
+_LATENCY_DISTS = ("fixed", "uniform", "exponential", "lognormal")
+
+_rng = random.Random(config["seed"])
+stats: Counter = Counter()
+
+app = FastAPI(title="KrisBot Fake Upstream")
+
+
+def _sample_latency() -> float:
+    """Seconds to delay this request, drawn from the configured distribution."""
+    mean = config["latency_ms"]
+    if mean <= 0:
+        return 0.0
+    dist = config["latency_dist"]
+    if dist == "fixed":
+        ms = mean
+    elif dist == "uniform":
+        ms = _rng.uniform(0, 2 * mean)
+    elif dist == "lognormal":
+        # sigma 1 gives a long tail; mu chosen so the mean stays `mean`
+        ms = _rng.lognormvariate(0, 1) * mean / 1.6487
+    else:
+        ms = _rng.expovariate(1 / mean)
+    return min(ms, config["latency_max_ms"]) / 1000
+
+
+async def _faults(route: str) -> Optional[Response]:
+    """Apply latency, then maybe return an injected 429 / 500 instead of the real answer."""
+    await asyncio.sleep(_sample_latency())
+    roll = _rng.random()
+    if roll < config["rate_limit_rate"]:
+        stats[(route, 429)] += 1
+        return Response(status_code=429, headers={"Retry-After": str(config["retry_after"])},
+                        content=json.dumps({"error": "rate limited"}), media_type="application/json")
+    if roll < config["rate_limit_rate"] + config["error_rate"]:
+        stats[(route, 500)] += 1
+        return Response(status_code=500, content=json.dumps({"error": "injected failure"}), media_type="application/json")
+    return None
+
+
+def _stable_int(seed: str, modulus: int) -> int:
+    return int(hashlib.sha256(seed.encode("utf-8")).hexdigest()[:8], 16) % modulus
+
+
+def _json_response(route: str, payload: Dict[str, Any], request: Optional[Request] = None,
+                   validators: bool = False) -> Response:
+    if config["body_kb"] > 0:
+        payload = dict(payload, padding="x" * (config["body_kb"] * 1024))
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    headers: Dict[str, str] = {}
+    if validators:
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        headers = {"ETag": etag, "Last-Modified": _LAST_MODIFIED, "Cache-Control": "no-cache"}
+        if request is not None and (
+            request.headers.get("if-none-match") == etag
+            or (not request.headers.get("if-none-match") and request.headers.get("if-modified-since") == _LAST_MODIFIED)
+        ):
+            stats[(route, 304)] += 1
+            return Response(status_code=304, headers=headers)
+    stats[(route, 200)] += 1
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _tiktok_profile(username: str) -> Dict[str, Any]:
+    return {
+        "user": {
+            "uniqueId": username,
+            "nickname": username.replace("_", " ").title(),
+            "avatar": f"https://example.com/avatars/{username}.jpg",
+            "signature": f"Fake upstream profile for {username}",
+        },
+        "stats": {
+            "followerCount": _stable_int(username + ":followers", 1_000_000),
+            "followingCount": _stable_int(username + ":following", 5_000),
+            "heartCount": _stable_int(username + ":likes", 10_000_000),
+            "videoCount": _stable_int(username + ":videos", 2_000),
+        },
+    }
+
+
+def _instagram_profile(username: str) -> Dict[str, Any]:
+    return {
+        "user": {
+            "username": username,
+            "full_name": username.replace("_", " ").title(),
+            "profile_pic_url": f"https://example.com/avatars/{username}.jpg",
+            "biography": f"Fake upstream profile for {username}",
+        },
+        "stats": {
+            "follower_count": _stable_int(username + ":followers", 1_000_000),
+            "following_count": _stable_int(username + ":following", 5_000),
+            "media_count": _stable_int(username + ":posts", 2_000),
+        },
+    }
+
+
+def _accounts(seed: str, platform: str) -> List[Dict[str, Any]]:
+    base = "user" + str(_stable_int(seed, 100_000))
+    host = "www.tiktok.com/@" if platform == "tiktok" else "www.instagram.com/"
+    return [
+        {"username": f"{base}_{i}", "url": f"https://{host}{base}_{i}",
+         "followers": _stable_int(f"{seed}:{i}", 1_000_000), "bio": f"Fake match {i} for {seed}"}
+        for i in range(1, config["accounts"] + 1)
+    ]
+
+
+class SearchRequest(BaseModel):
+    email: str = ""
+    phone: str = ""
+
+
+class ScrapeRequest(BaseModel):
+    url: str
+
+
+@app.get("/api/tiktok/user/{username}")
+async def forestapi_tiktok(username: str, request: Request) -> Response:
+    route = "forestapi_tiktok"
+    return await _faults(route) or _json_response(route, _tiktok_profile(username), request, validators=True)
+
+
+@app.get("/api/instagram/user/{username}")
+async def forestapi_instagram(username: str, request: Request) -> Response:
+    route = "forestapi_instagram"
+    return await _faults(route) or _json_response(route, _instagram_profile(username), request, validators=True)
+
+
+@app.post("/tiktok/search")
+async def tiktok_search(req: SearchRequest) -> Response:
+    route = "tiktok_search"
+    return await _faults(route) or _json_response(route, {"accounts": _accounts(f"{req.email}|{req.phone}", "tiktok")})
+
+
+@app.post("/instagram/scrape")
+async def instagram_scrape(req: ScrapeRequest) -> Response:
+    route = "instagram_scrape"
+    return await _faults(route) or _json_response(route, {"accounts": _accounts(req.url, "instagram")})
+
+
+@app.get("/_config")
+async def get_config() -> Dict[str, Any]:
+    return config
+
+
+@app.post("/_config")
+async def set_config(changes: Dict[str, Any]) -> Response:
+    unknown = set(changes) - set(config)
+    if unknown:
+        return Response(status_code=400, content=json.dumps({"error": f"unknown settings: {sorted(unknown)}"}),
+                        media_type="application/json")
+    if "latency_dist" in changes and changes["latency_dist"] not in _LATENCY_DISTS:
+        return Response(status_code=400, content=json.dumps({"error": f"latency_dist must be one of {_LATENCY_DISTS}"}),
+                        media_type="application/json")
+    config.update({k: type(config[k])(v) for k, v in changes.items()})
+    if "seed" in changes:
+        _rng.seed(config["seed"])
+    return Response(content=json.dumps(config), media_type="application/json")
+
+
+@app.get("/_stats")
+async def get_stats() -> Dict[str, Dict[str, int]]:
+    by_route: Dict[str, Dict[str, int]] = {}
+    for (route, status), count in sorted(stats.items()):
+        by_route.setdefault(route, {})[str(status)] = count
+    return by_route
+
+
+@app.post("/_stats/reset")
+async def reset_stats() -> Dict[str, bool]:
+    stats.clear()
+    _rng.seed(config["seed"])
+    return {"ok": True}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""Run KrisBot as one front process plus N worker processes, sharded by user id.
+
+The front process receives updates (polling, or webhook with BOT_MODE=webhook) and
+forwards each one to worker `zlib.crc32(_uid(user.id)) % N`. Every update of a given
+user therefore lands on the same worker. Each worker is a regular KrisBot application
+(without an updater) that owns its shard of state on disk: its own user_data
+snapshot/journal, scrape history database and HTTP cache. There is no cross-process
+locking.
+
+Layout under SHARD_DIR (default ./shards):
+
+  manifest.json              {"workers": N, "generation": G}
+  gen-G/shard-<i>/           user_data.json, user_data.journal, scrape_history.db, .http_cache/,
+                             username_cache.db
+
+Changing N rebalances on startup, before any worker runs. All shards of the current
+generation are read and redistributed into gen-(G+1). manifest.json is then switched
+over atomically and the old generation is removed. An interrupted rebalance leaves
+the manifest pointing at the old, intact generation and is simply redone on the
+next start. The first sharded start imports the single-process files
+(user_data.json, user_data.journal, scrape_history.db) and leaves them in place.
+
+Usage:
+  python3 supervisor.py --workers 4            # or SHARD_WORKERS=4 ./supervisor.py
+  BOT_MODE=webhook WEBHOOK_URL=... python3 supervisor.py --workers 4
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import time
+import zlib
+from queue import Empty, Full
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("supervisor")
+
+SHARD_DIR = os.environ.get("SHARD_DIR", "shards")
+SHARD_WORKERS = max(1, int(os.environ.get("SHARD_WORKERS", str(os.cpu_count() or 1))))
+# Updates buffered per worker before the front process stops reading new ones
+SHARD_QUEUE_SIZE = max(1, int(os.environ.get("SHARD_QUEUE_SIZE", "1000")))
+# Seconds between liveness checks; dead workers are restarted on their shard
+SHARD_MONITOR_INTERVAL = float(os.environ.get("SHARD_MONITOR_INTERVAL", "2.0"))
+SHARD_STOP_TIMEOUT = float(os.environ.get("SHARD_STOP_TIMEOUT", "30.0"))
+# How often a worker blocked on its empty shard queue checks whether it should stop
+SHARD_POLL_INTERVAL = 0.5
+
+MANIFEST = "manifest.json"
+
+
+def shard_for(uid: str, workers: int) -> int:
+    """Shard index for a `_uid(user.id)` key. Stable across processes and restarts."""
+    return zlib.crc32(uid.encode("utf-8")) % workers
+
+
+def shard_env(directory: str) -> Dict[str, str]:
+    """Environment that points a KrisBot process at the state files in `directory`."""
+    return {
+        "USER_DATA_FILE": os.path.join(directory, "user_data.json"),
+        "USER_DATA_JOURNAL": os.path.join(directory, "user_data.journal"),
+        "SCRAPE_HISTORY_DB": os.path.join(directory, "scrape_history.db"),
+        "HTTP_CACHE_DIR": os.path.join(directory, ".http_cache"),
+        "USERNAME_CACHE_DB": os.path.join(directory, "username_cache.db"),
+    }
+
+
+def _unsharded_env() -> Dict[str, str]:
+    return {
+        "USER_DATA_FILE": os.environ.get("USER_DATA_FILE", "user_data.json"),
+        "USER_DATA_JOURNAL": os.environ.get("USER_DATA_JOURNAL", "user_data.journal"),
+        "SCRAPE_HISTORY_DB": os.environ.get("SCRAPE_HISTORY_DB", "scrape_history.db"),
+    }
+
+
+def _read_manifest(shard_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(shard_dir, MANIFEST), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json_atomic(path: str, payload: Any) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_user_records(env: Dict[str, str]) -> Dict[str, Any]:
+    """Stored user records of one shard: the snapshot with its journal replayed on top.
+
+    Records are moved verbatim; a worker upgrades older record formats itself when it
+    loads its shard.
+    """
+    from KrisBot import _read_journal
+
+    data: Dict[str, Any] = {}
+    if os.path.exists(env["USER_DATA_FILE"]):
+        with open(env["USER_DATA_FILE"], "r") as f:
+            data = json.load(f)
+    # Torn or malformed lines are skipped; the records are rewritten into fresh shard
+    # snapshots, so the source journal itself is left as it is
+    entries, _damaged, _intact_size = _read_journal(env["USER_DATA_JOURNAL"])
+    for entry in entries:
+        if entry.get("v") is None:
+            data.pop(entry["k"], None)
+        else:
+            data[entry["k"]] = entry["v"]
+    return data
+
+
+def prepare_shards(shard_dir: str, workers: int) -> List[Dict[str, str]]:
+    """Make sure SHARD_DIR holds exactly `workers` shards, rebalancing if needed.
+
+    Returns the per-worker environment overrides, indexed by shard.
+    """
+    from KrisBot import ScrapeHistoryStore
+
+    manifest = _read_manifest(shard_dir)
+    if manifest is not None:
+        generation = manifest["generation"]
+        old_dirs = [os.path.join(shard_dir, f"gen-{generation}", f"shard-{i}") for i in range(manifest["workers"])]
+        if manifest["workers"] == workers:
+            return [shard_env(d) for d in old_dirs]
+        sources = [shard_env(d) for d in old_dirs]
+    else:
+        generation = 0
+        sources = [_unsharded_env()]
+
+    started = time.monotonic()
+    new_gen_dir = os.path.join(shard_dir, f"gen-{generation + 1}")
+    # Left over from an interrupted rebalance; the manifest never pointed at it
+    shutil.rmtree(new_gen_dir, ignore_errors=True)
+    new_dirs = [os.path.join(new_gen_dir, f"shard-{i}") for i in range(workers)]
+    for d in new_dirs:
+        os.makedirs(d)
+    targets = [shard_env(d) for d in new_dirs]
+
+    buckets: List[Dict[str, Any]] = [{} for _ in range(workers)]
+    for src in sources:
+        for key, record in _read_user_records(src).items():
+            buckets[shard_for(key, workers)][key] = record
+    for target, records in zip(targets, buckets):
+        _write_json_atomic(target["USER_DATA_FILE"], records)
+
+    history_rows = 0
+    for index, target in enumerate(targets):
+        store = ScrapeHistoryStore(path=target["SCRAPE_HISTORY_DB"])
+        try:
+            for src in sources:
+                if os.path.exists(src["SCRAPE_HISTORY_DB"]):
+                    history_rows += store.copy_from(
+                        src["SCRAPE_HISTORY_DB"], lambda uid, index=index: shard_for(uid, workers) == index
+                    )
+        finally:
+            store.close()
+
+    os.makedirs(shard_dir, exist_ok=True)
+    _write_json_atomic(os.path.join(shard_dir, MANIFEST), {"workers": workers, "generation": generation + 1})
+    if manifest is not None:
+        shutil.rmtree(os.path.join(shard_dir, f"gen-{generation}"), ignore_errors=True)
+    logger.info(
+        "Rebalanced %d user(s) and %d history row(s) from %d into %d shard(s) in %.1fs",
+        sum(len(b) for b in buckets), history_rows, len(sources), workers, time.monotonic() - started,
+    )
+    if manifest is None:
+        logger.info("Imported the single-process state files; they are no longer used in sharded mode")
+    return targets
+
+
+def _worker_main(index: int, workers: int, env: Dict[str, str], token: str, queue) -> None:
+    """Entry point of a worker process (spawned, so KrisBot is imported fresh here)."""
+    # Ctrl-C reaches the whole process group; the front process stops workers in order.
+    # SIGTERM (e.g. systemctl stop) is handled in _serve_worker with a clean shutdown.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Until _serve_worker handles it; a worker starting during a reload already gets
+    # the front process's reloaded environment
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    os.environ.update(env)
+    if int(os.environ.get("METRICS_PORT", "0")):
+        # Workers cannot share one port: worker i serves /metrics on METRICS_PORT + 1 + i
+        os.environ["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + 1 + index)
+    import KrisBot
+
+    asyncio.run(_serve_worker(KrisBot, index, workers, token, queue))
+
+
+async def _serve_worker(bot_module, index: int, workers: int, token: str, queue) -> None:
+    from telegram import Update
+
+    app = bot_module.build_application(token, update_queue_size=SHARD_QUEUE_SIZE)
+
+    def reload_settings() -> None:
+        try:
+            app.bot_data["settings"] = bot_module.reload_settings()
+        except ValueError as e:
+            logger.warning("Worker %d kept its configuration: %s", index, e)
+            return
+        logger.info("Worker %d reloaded its configuration", index)
+
+    def broadcast_reload() -> int:
+        # Settings live per process: /reload_config only ran in this worker, so the
+        # front process passes the reload on to every worker (see ShardRouter.reload)
+        os.kill(os.getppid(), signal.SIGHUP)
+        return workers
+
+    app.bot_data["reload_broadcast"] = broadcast_reload
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    logger.info("Worker %d serving %s", index, os.environ["USER_DATA_FILE"])
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    # Stop taking updates and run the normal shutdown, which flushes buffered user_data
+    loop.add_signal_handler(signal.SIGTERM, stopping.set)
+    loop.add_signal_handler(signal.SIGHUP, reload_settings)
+    try:
+        while not stopping.is_set():
+            try:
+                # A timeout, so the executor thread is never left blocked on the queue at exit
+                data = await loop.run_in_executor(None, queue.get, True, SHARD_POLL_INTERVAL)
+            except Empty:
+                continue
+            if data is None:
+                break
+            update = Update.de_json(data, app.bot)
+            # Wait until fewer than SHARD_QUEUE_SIZE updates are in flight here, so a slow
+            # worker leaves its backlog in the shard queue and the front process blocks
+            await app.update_processor.wait_admit(update)
+            await app.update_queue.put(update)
+    finally:
+        await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+        logger.info("Worker %d stopped", index)
+
+
+class ShardRouter:
+    """Owns the worker processes and their update queues.
+
+    Workers are started from the front application's post_init, so nothing is spawned
+    if the front process fails to come up.
+    """
+
+    def __init__(self, token: str, envs: List[Dict[str, str]]):
+        self.token = token
+        self.envs = envs
+        self._ctx = multiprocessing.get_context("spawn")
+        # Queues belong to the front process, so updates survive a worker restart
+        self.queues = [self._ctx.Queue(maxsize=SHARD_QUEUE_SIZE) for _ in envs]
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * len(envs)
+        self._stopping = False
+        self._monitor: Optional[asyncio.Task] = None
+
+    def _spawn(self, index: int) -> None:
+        env = dict(self.envs[index])
+        # Telegram's ~30 messages/s limit applies to the bot as a whole, so each
+        # worker gets an equal share of it
+        env["SEND_GLOBAL_RATE"] = str(float(os.environ.get("SEND_GLOBAL_RATE", "30")) / len(self.envs))
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(index, len(self.envs), env, self.token, self.queues[index]),
+            name=f"krisbot-shard-{index}",
+        )
+        proc.start()
+        self.processes[index] = proc
+
+    def start(self) -> None:
+        for index in range(len(self.envs)):
+            self._spawn(index)
+
+    async def route(self, update, context) -> None:
+        from KrisBot import _uid
+
+        user = update.effective_user
+        chat = update.effective_chat
+        if user is not None:
+            index = shard_for(_uid(user.id), len(self.queues))
+        elif chat is not None:
+            index = shard_for(_uid(chat.id), len(self.queues))
+        else:
+            index = 0
+        # Blocks (off the loop) while the worker is backlogged, which in turn
+        # stops the front process from fetching more updates
+        await asyncio.get_running_loop().run_in_executor(None, self.queues[index].put, update.to_dict())
+
+    async def _watch(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(SHARD_MONITOR_INTERVAL)
+            for index, proc in enumerate(self.processes):
+                # Exit code 0 means the worker stopped cleanly (shutdown or SIGTERM)
+                if not self._stopping and proc is not None and not proc.is_alive() and proc.exitcode != 0:
+                    logger.error("Worker %d exited with code %s; restarting it", index, proc.exitcode)
+                    self._spawn(index)
+
+    def reload(self) -> None:
+        """SIGHUP: reload the configuration here and in every worker.
+
+        Reloading the front process too means restarted workers inherit the new values.
+        """
+        from KrisBot import reload_settings
+
+        try:
+            reload_settings()
+        except ValueError as e:
+            logger.warning("Configuration reload rejected: %s", e)
+            return
+        for proc in self.processes:
+            if proc is not None and proc.is_alive():
+                os.kill(proc.pid, signal.SIGHUP)
+        logger.info("Configuration reload sent to %d worker(s)", len(self.processes))
+
+    async def post_init(self, application) -> None:
+        self.start()
+        self._monitor = asyncio.create_task(self._watch())
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self.reload)
+
+    async def post_shutdown(self, application) -> None:
+        self._stopping = True
+        if self._monitor is not None:
+            self._monitor.cancel()
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + SHARD_STOP_TIMEOUT
+        for index, (queue, proc) in enumerate(zip(self.queues, self.processes)):
+            if proc is None or not proc.is_alive():
+                continue  # a dead worker's queue may be full; nobody would take the sentinel
+            put = functools.partial(queue.put, None, timeout=max(0.0, deadline - time.monotonic()))
+            try:
+                await loop.run_in_executor(None, put)
+            except Full:
+                logger.warning("Worker %d did not drain its queue in time; asking it to stop", index)
+                proc.terminate()
+        for index, proc in enumerate(self.processes):
+            if proc is None:
+                continue
+            await loop.run_in_executor(None, proc.join, max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                logger.warning("Worker %d did not stop in time; killing it", index)
+                proc.kill()
+
+
+def build_front_application(token: str, router: ShardRouter, update_queue_size: Optional[int] = None):
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder, TypeHandler
+
+    builder = ApplicationBuilder().token(token).post_init(router.post_init).post_shutdown(router.post_shutdown)
+    if update_queue_size is not None:
+        builder = builder.updater(None).update_queue(asyncio.Queue(maxsize=update_queue_size))
+    app = builder.build()
+    app.add_handler(TypeHandler(Update, router.route))
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=SHARD_WORKERS, help="number of worker processes / shards")
+    parser.add_argument("--shard-dir", default=SHARD_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    token = os.environ.get("TELEGRAM_BOT_API_TOKEN")
+    if not token:
+        raise SystemExit("TELEGRAM_BOT_API_TOKEN is not set.")
+    if args.workers < 1:
+        raise SystemExit("--workers must be at least 1")
+
+    envs = prepare_shards(args.shard_dir, args.workers)
+    router = ShardRouter(token, envs)
+
+    mode = os.environ.get("BOT_MODE", "polling").strip().lower()
+    if mode == "webhook":
+        from webhook_server import WEBHOOK_QUEUE_SIZE, run_webhook
+
+        run_webhook(build_front_application(token, router, update_queue_size=WEBHOOK_QUEUE_SIZE))
+    else:
+        build_front_application(token, router).run_polling()
+
+
+if __name__ == "__main__":
+    main()
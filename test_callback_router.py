@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Callback query routing checks.
+
+Usage:
+  python3 test_callback_router.py     (or: python3 -m pytest test_callback_router.py)
+"""
+
+import asyncio
+
+import KrisBot
+
+
+class _Query:
+    def __init__(self, data):
+        self.data = data
+        self.answered = False
+
+    async def answer(self):
+        self.answered = True
+
+
+class _Update:
+    def __init__(self, data):
+        self.callback_query = _Query(data)
+
+
+def test_routes_exact_and_prefix():
+    calls = []
+
+    async def exact(update, context):
+        calls.append("exact")
+
+    async def prefixed(update, context, payload):
+        calls.append(payload)
+
+    router = KrisBot.CallbackRouter()
+    router.add("back", exact)
+    router.add_prefix("custom", prefixed)
+    assert asyncio.run(router.dispatch(None, None, "back"))
+    assert asyncio.run(router.dispatch(None, None, "custom:Mastodon"))
+    assert not asyncio.run(router.dispatch(None, None, "unknown"))
+    assert calls == ["exact", "Mastodon"]
+
+
+def test_callback_without_data_is_answered():
+    # Game callbacks and some inline-mode callbacks have no data
+    for data in (None, ""):
+        update = _Update(data)
+        asyncio.run(KrisBot.handle_callback(update, None))
+        assert update.callback_query.answered
+        assert not asyncio.run(KrisBot.CallbackRouter().dispatch(update, None, data))
+
+
+if __name__ == "__main__":
+    test_routes_exact_and_prefix()
+    test_callback_without_data_is_answered()
+    print("OK")
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""Runs the import-time budget check of check_import_time.py with the tests.
+
+Usage:
+  python3 test_import_time.py     (or: python3 -m pytest test_import_time.py)
+"""
+
+import check_import_time
+
+
+def test_import_time_within_budget():
+    budget_ms = check_import_time.default_budget_ms()
+    cumulative_us, _ = check_import_time.best_of("KrisBot", runs=3)
+    assert cumulative_us / 1000 <= budget_ms, (
+        f"import KrisBot took {cumulative_us / 1000:.1f} ms (budget {budget_ms:.0f} ms); "
+        "run check_import_time.py to see the slowest imports")
+
+
+if __name__ == "__main__":
+    test_import_time_within_budget()
+    print("OK")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Background job manager checks.
+
+One user cannot fill the job pool, and shutdown lets a result that is already
+being delivered finish instead of losing it.
+
+Usage:
+  python3 test_jobs.py     (or: python3 -m pytest test_jobs.py)
+"""
+
+import asyncio
+import os
+import tempfile
+
+import KrisBot
+
+
+class _Message:
+    def __init__(self, chat, edit_delay=0.0):
+        self.chat = chat
+        self.edit_delay = edit_delay
+
+    async def edit_text(self, text):
+        await asyncio.sleep(self.edit_delay)
+        self.chat.append(text)
+
+
+class _Update:
+    def __init__(self, edit_delay=0.0):
+        self.sent = []
+        self.edit_delay = edit_delay
+        self.message = self
+
+    async def reply_text(self, text):
+        self.sent.append(text)
+        return _Message(self.sent, self.edit_delay)
+
+
+def _manager(directory, **kwargs):
+    store = KrisBot.ScrapeHistoryStore(os.path.join(directory, "scrape_history.db"))
+    return KrisBot.JobManager(store, workers=4, **kwargs)
+
+
+def test_per_user_job_cap():
+    async def run(directory):
+        manager = _manager(directory, max_per_user=2)
+        await manager.start()
+        release = asyncio.Event()
+
+        async def blocked(job):
+            await release.wait()
+            return "done"
+
+        first, second, third = _Update(), _Update(), _Update()
+        assert await manager.submit(first, "1", "tiktok", "a", "Scraping a", blocked) is not None
+        assert await manager.submit(second, "1", "tiktok", "b", "Scraping b", blocked) is not None
+        assert await manager.submit(third, "1", "tiktok", "c", "Scraping c", blocked) is None
+        assert "You already have 2 jobs" in third.sent[0]
+        # Other users are not affected
+        assert await manager.submit(_Update(), "2", "tiktok", "d", "Scraping d", blocked) is not None
+
+        release.set()
+        while len(manager):
+            await asyncio.sleep(0.01)
+        assert await manager.submit(_Update(), "1", "tiktok", "e", "Scraping e", blocked) is not None
+        await manager.stop()
+        manager.store.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(directory))
+
+
+def test_stop_delivers_result_in_flight():
+    async def run(directory):
+        manager = _manager(directory)
+        await manager.start()
+        update = _Update(edit_delay=0.3)
+
+        async def quick(job):
+            return "3 accounts found"
+
+        job = await manager.submit(update, "1", "tiktok", "a", "Scraping a", quick)
+        while job.status != "done":
+            await asyncio.sleep(0.01)
+        # The result edit is under way when shutdown starts
+        await manager.stop()
+        assert update.sent[-1] == "3 accounts found"
+        saved = await manager.store.job("1", job.id)
+        assert saved["status"] == "done"
+        manager.store.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(directory))
+
+
+if __name__ == "__main__":
+    test_per_user_job_cap()
+    test_stop_delivers_result_in_flight()
+    print("OK")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Crash-recovery check for the user_data journal.
+
+A crash can leave the journal's last line torn. After a restart the next append
+must not be glued onto that line, or the new record is lost with it on the
+following load.
+
+Usage:
+  python3 test_journal_recovery.py     (or: python3 -m pytest test_journal_recovery.py)
+"""
+
+import contextlib
+import os
+import tempfile
+
+import KrisBot
+
+
+@contextlib.contextmanager
+def _use_files():
+    """Point KrisBot's user data at a temporary directory; restored afterwards."""
+    saved = (KrisBot.USER_DATA_FILE, KrisBot.USER_DATA_JOURNAL, KrisBot._journal_entries)
+    with tempfile.TemporaryDirectory() as directory:
+        KrisBot.USER_DATA_FILE = os.path.join(directory, "user_data.json")
+        KrisBot.USER_DATA_JOURNAL = os.path.join(directory, "user_data.journal")
+        try:
+            yield directory
+        finally:
+            KrisBot.USER_DATA_FILE, KrisBot.USER_DATA_JOURNAL, KrisBot._journal_entries = saved
+
+
+def test_torn_tail_does_not_swallow_next_record():
+    with _use_files():
+        data = {"1": KrisBot.UserRecord(email="one@example.com")}
+        KrisBot.save_user_data(data, "1")
+        with open(KrisBot.USER_DATA_JOURNAL, "a") as f:
+            f.write('{"k":"2","v":{"ema')  # crash mid-append
+
+        data = KrisBot.load_user_data()
+        assert set(data) == {"1"}
+        data["3"] = KrisBot.UserRecord(email="three@example.com")
+        KrisBot.save_user_data(data, "3")
+
+        data = KrisBot.load_user_data()
+        assert set(data) == {"1", "3"}
+        assert data["3"].email == "three@example.com"
+
+
+def test_unterminated_complete_line_is_kept():
+    with _use_files():
+        data = {"1": KrisBot.UserRecord(email="one@example.com")}
+        KrisBot.save_user_data(data, "1")
+        # Crash after the record but before its newline
+        with open(KrisBot.USER_DATA_JOURNAL, "rb+") as f:
+            f.truncate(os.path.getsize(KrisBot.USER_DATA_JOURNAL) - 1)
+
+        data = KrisBot.load_user_data()
+        data["2"] = KrisBot.UserRecord(email="two@example.com")
+        KrisBot.save_user_data(data, "2")
+
+        assert set(KrisBot.load_user_data()) == {"1", "2"}
+
+
+if __name__ == "__main__":
+    test_torn_tail_does_not_swallow_next_record()
+    test_unterminated_complete_line_is_kept()
+    print("OK")
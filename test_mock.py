@@ -18,6 +18,7 @@ Commands available in the REPL:
 import asyncio
 import os
 import json
+from itertools import islice
 from typing import Any
 
 from KrisBot import (
@@ -79,7 +80,7 @@ async def repl():
                 continue
             pattern = args[0]
             candidates = _expand_pattern(pattern, max_len=2)
-            print(f"Generated {len(candidates)} candidates (showing up to 20): {candidates[:20]}")
+            print(f"Generated {len(candidates)} candidates (showing up to 20): {list(islice(candidates, 20))}")
             found = await _probe_usernames(candidates, concurrency=5)
             print("Found:", found)
         else:
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Disk response cache checks.
+
+A failing cache write must not fail the lookup that produced the result, and
+concurrent writers of the same URL must not clobber each other's files.
+
+Usage:
+  python3 test_response_cache.py     (or: python3 -m pytest test_response_cache.py)
+"""
+
+import asyncio
+import os
+import tempfile
+
+import KrisBot
+
+URL = "https://forestapi.vercel.app/api/tiktok/user/bench"
+
+
+def test_write_failure_is_not_raised():
+    async def run(directory):
+        blocker = os.path.join(directory, "not-a-directory")
+        with open(blocker, "w") as f:
+            f.write("")
+        # Creating the cache directory below a regular file fails with an OSError
+        cache = KrisBot.DiskResponseCache(os.path.join(blocker, "cache"))
+        await cache.put(URL, '"v1"', None, [{"username": "bench"}])
+        assert await cache.get(URL) is None
+        assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(directory))
+
+
+def test_concurrent_writes_of_one_url():
+    async def run(directory):
+        cache = KrisBot.DiskResponseCache(directory)
+        await asyncio.gather(*(cache.put(URL, f'"v{i}"', None, [{"n": i}]) for i in range(20)))
+        entry = await cache.get(URL)
+        assert entry is not None and entry["url"] == URL
+        assert sorted(os.listdir(directory)) == [KrisBot.DiskResponseCache._name(URL)]
+        assert cache.stats()["entries"] == 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(directory))
+
+
+if __name__ == "__main__":
+    test_write_failure_is_not_raised()
+    test_concurrent_writes_of_one_url()
+    print("OK")
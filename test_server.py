@@ -8,12 +8,23 @@ Endpoints:
   POST /facebook/by_url  {"url":...}
   POST /probe            {"pattern":...}
 
+Batch variants stream one NDJSON line per item as soon as it completes
+({"index", "input", "status": "ok"|"error", "result"|"error"}):
+  POST /tiktok/search/batch    {"items": [{"email":..., "phone":...}, ...]}
+  POST /tiktok/by_url/batch    {"urls": [...]}
+  POST /instagram/by_url/batch {"urls": [...]}
+  POST /facebook/by_url/batch  {"urls": [...]}
+At most BATCH_CONCURRENCY items (default 16) run at once across all batch requests,
+and a batch may hold at most BATCH_MAX_ITEMS items (default 1000).
+
 By default this server forces MOCK_MODE=1 so responses are deterministic and safe.
 """
 
 import os
-from typing import List, Dict, Any
+import json
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import asyncio
 
@@ -27,10 +38,24 @@ from KrisBot import (
     perform_facebook_scrape_by_url,
     _expand_pattern,
     _probe_usernames,
+    close_http_clients,
+    get_settings,
+    username_cache,
 )
 
 app = FastAPI(title="KrisBot Test Server")
 
+BATCH_CONCURRENCY = max(1, int(os.environ.get("BATCH_CONCURRENCY", "16")))
+BATCH_MAX_ITEMS = max(1, int(os.environ.get("BATCH_MAX_ITEMS", "1000")))
+# Shared by every batch request, so concurrent batches cannot multiply the load
+_batch_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+
+@app.on_event("shutdown")
+async def _close_clients() -> None:
+    await close_http_clients()
+    username_cache.close()
+
 
 class TikTokSearchRequest(BaseModel):
     email: str
@@ -45,6 +70,14 @@ class ProbeRequest(BaseModel):
     pattern: str
 
 
+class TikTokSearchBatchRequest(BaseModel):
+    items: List[TikTokSearchRequest]
+
+
+class URLBatchRequest(BaseModel):
+    urls: List[str]
+
+
 @app.post("/tiktok/search")
 async def tiktok_search(req: TikTokSearchRequest) -> List[Dict[str, Any]]:
     res = await perform_tiktok_scrape(email=req.email, phone=req.phone)
@@ -69,15 +102,61 @@ async def facebook_by_url(req: URLRequest) -> List[Dict[str, Any]]:
     return res
 
 
+async def _stream_batch(inputs: List[Any], run: Callable[[Any], Awaitable[Any]]) -> AsyncIterator[str]:
+    """Run `run` on every input under the shared cap and yield NDJSON lines in completion order."""
+
+    async def _one(index: int, item: Any) -> Dict[str, Any]:
+        async with _batch_semaphore:
+            try:
+                return {"index": index, "input": item, "status": "ok", "result": await run(item)}
+            except Exception as e:
+                return {"index": index, "input": item, "status": "error", "error": f"{type(e).__name__}: {e}"}
+
+    tasks = [asyncio.create_task(_one(i, item)) for i, item in enumerate(inputs)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + "\n"
+    finally:
+        # client went away mid-stream: stop the remaining work
+        for task in tasks:
+            task.cancel()
+
+
+def _batch_response(inputs: List[Any], run: Callable[[Any], Awaitable[Any]]) -> StreamingResponse:
+    if len(inputs) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"at most {BATCH_MAX_ITEMS} items per batch")
+    return StreamingResponse(_stream_batch(inputs, run), media_type="application/x-ndjson")
+
+
+@app.post("/tiktok/search/batch")
+async def tiktok_search_batch(req: TikTokSearchBatchRequest) -> StreamingResponse:
+    items = [{"email": item.email, "phone": item.phone} for item in req.items]
+    return _batch_response(items, lambda item: perform_tiktok_scrape(email=item["email"], phone=item["phone"]))
+
+
+@app.post("/tiktok/by_url/batch")
+async def tiktok_by_url_batch(req: URLBatchRequest) -> StreamingResponse:
+    return _batch_response(req.urls, perform_tiktok_scrape_by_url)
+
+
+@app.post("/instagram/by_url/batch")
+async def instagram_by_url_batch(req: URLBatchRequest) -> StreamingResponse:
+    return _batch_response(req.urls, perform_instagram_scrape_by_url)
+
+
+@app.post("/facebook/by_url/batch")
+async def facebook_by_url_batch(req: URLBatchRequest) -> StreamingResponse:
+    return _batch_response(req.urls, perform_facebook_scrape_by_url)
+
+
 @app.post("/probe")
 async def probe(req: ProbeRequest) -> Dict[str, Any]:
     pattern = req.pattern
-    candidates = _expand_pattern(pattern, max_len=int(os.environ.get("PROBE_MAX_LEN", "2")))
+    settings = get_settings()
     # limit to avoid heavy loads
-    limit = int(os.environ.get("PROBE_CANDIDATE_LIMIT", "200"))
-    candidates = candidates[:limit]
-    found = await _probe_usernames(candidates, concurrency=int(os.environ.get("PROBE_CONCURRENCY", "5")))
-    return {"pattern": pattern, "generated": len(candidates), "found": found}
+    candidates = _expand_pattern(pattern, max_len=settings.probe_max_len, limit=settings.probe_candidate_limit)
+    found = await _probe_usernames(candidates, concurrency=settings.probe_concurrency, cache=username_cache)
+    return {"pattern": pattern, "generated": len(candidates), "total": candidates.total, "found": found}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Username existence cache checks.
+
+Usage:
+  python3 test_username_cache.py     (or: python3 -m pytest test_username_cache.py)
+"""
+
+import asyncio
+import os
+import tempfile
+
+import KrisBot
+
+
+class _CountingCache(KrisBot.UsernameExistenceCache):
+    loads = 0
+
+    def _load(self):
+        self.loads += 1
+        return super()._load()
+
+
+def test_concurrent_first_lookups_load_once():
+    async def run(path):
+        writer = KrisBot.UsernameExistenceCache(path)
+        await writer.store({"alice": True, "bob": False})
+        writer.close()
+
+        cache = _CountingCache(path)
+
+        async def lookup(username):
+            await cache.ensure_loaded()
+            return cache.lookup(username)
+
+        # Every caller sees the stored answers, not an empty cache
+        assert await asyncio.gather(lookup("alice"), lookup("bob"), lookup("carol")) == [True, False, None]
+        assert cache.loads == 1
+        cache.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(os.path.join(directory, "username_cache.db")))
+
+
+if __name__ == "__main__":
+    test_concurrent_first_lookups_load_once()
+    print("OK")
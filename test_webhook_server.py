@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Webhook endpoint checks, driven through httpx.ASGITransport.
+
+Without the startup event nothing consumes the update queue, so accepted updates
+stay queued and count against the backlog.
+
+Usage:
+  python3 test_webhook_server.py     (or: python3 -m pytest test_webhook_server.py)
+"""
+
+import asyncio
+
+import httpx
+from telegram import Update
+
+import KrisBot
+import webhook_server
+
+TOKEN = "123456:WEBHOOK-TEST-TOKEN"
+SECRET = "test-secret"
+HEADERS = {webhook_server.SECRET_HEADER: SECRET}
+
+
+def _update(update_id: int):
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": 0, "text": "/start",
+                    "chat": {"id": 7, "type": "private"}, "from": {"id": 7, "is_bot": False, "first_name": "T"}},
+    }
+
+
+def _client(application):
+    app = webhook_server.create_webhook_app(application, SECRET)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_rejects_bad_requests():
+    async def run():
+        application = KrisBot.build_application(TOKEN, update_queue_size=10)
+        async with _client(application) as client:
+            assert (await client.post("/telegram", json=_update(1))).status_code == 403
+            assert (await client.post("/telegram", json=_update(1),
+                                      headers={webhook_server.SECRET_HEADER: "wrong"})).status_code == 403
+            assert (await client.post("/telegram", content=b"{not json", headers=HEADERS)).status_code == 400
+            for body in ([], 1, "x", None):
+                assert (await client.post("/telegram", json=body, headers=HEADERS)).status_code == 400
+        assert application.update_queue.qsize() == 0
+
+    asyncio.run(run())
+
+
+def test_accepts_until_backlog_is_full():
+    async def run():
+        application = KrisBot.build_application(TOKEN, update_queue_size=2)
+        async with _client(application) as client:
+            statuses = [(await client.post("/telegram", json=_update(i), headers=HEADERS)).status_code
+                        for i in range(1, 4)]
+            assert statuses == [200, 200, 503]
+            health = (await client.get("/healthz")).json()
+            assert health["pending"] == 2 and health["capacity"] == 2
+        queued = [application.update_queue.get_nowait().update_id for _ in range(2)]
+        assert queued == [1, 2]
+
+    asyncio.run(run())
+
+
+def test_backlog_recovers_after_release():
+    async def run():
+        application = KrisBot.build_application(TOKEN, update_queue_size=2)
+        processor = application.update_processor
+        async with _client(application) as client:
+            post = lambda i: client.post("/telegram", json=_update(i), headers=HEADERS)
+            assert (await post(1)).status_code == 200
+            # Telegram redelivers update 1 while the first copy is still pending
+            assert (await post(1)).status_code == 200
+            assert (await post(2)).status_code == 503
+            assert processor.admitted == 2
+
+            # One copy finishes: only its own place is freed
+            processor.release(application.update_queue.get_nowait())
+            assert processor.admitted == 1
+            assert (await post(2)).status_code == 200
+            assert (await post(3)).status_code == 503
+
+            for _ in range(2):
+                processor.release(application.update_queue.get_nowait())
+            assert processor.admitted == 0
+            assert (await post(3)).status_code == 200
+
+    asyncio.run(run())
+
+
+def test_same_update_object_admitted_twice():
+    application = KrisBot.build_application(TOKEN, update_queue_size=2)
+    processor = application.update_processor
+    update = Update.de_json(_update(1), application.bot)
+    assert processor.admit(update) and processor.admit(update)
+    assert not processor.admit(update)
+    processor.release(update)
+    assert processor.admitted == 1
+    processor.release(update)
+    processor.release(update)  # not admitted any more: no effect
+    assert processor.admitted == 0
+
+
+if __name__ == "__main__":
+    test_rejects_bad_requests()
+    test_accepts_until_backlog_is_full()
+    test_backlog_recovers_after_release()
+    test_same_update_object_admitted_twice()
+    print("OK")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Webhook delivery mode for KrisBot, served from a FastAPI app.
+
+Instead of polling getUpdates, Telegram POSTs each update to this server:
+
+  POST {WEBHOOK_PATH}  Telegram update JSON (default path /telegram)
+  GET  /healthz        queued and pending updates, and the backlog cap
+
+Every POST must carry the X-Telegram-Bot-Api-Secret-Token header that was passed to
+setWebhook; anything else gets 403. At most WEBHOOK_QUEUE_SIZE updates are held at
+once, counting those still queued, waiting for the same user's earlier updates and
+running. Past that the request is answered with 503, so Telegram keeps the update
+and redelivers it later instead of this process buffering without limit.
+
+Start it with `BOT_MODE=webhook python3 KrisBot.py` (see README). In tests, build the
+ASGI app with create_webhook_app(application, secret) and POST updates to it through
+httpx.AsyncClient(transport=httpx.ASGITransport(app=...)); without the startup event
+nothing consumes the queue, so the posted updates can be read back from
+application.update_queue.
+"""
+
+import asyncio
+import hmac
+import logging
+import os
+import re
+import secrets
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, Request, Response
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Public https base URL Telegram should POST to, e.g. https://bot.example.com
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+# Random per process when unset; setWebhook is called on every start, so that is safe
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_QUEUE_SIZE = max(1, int(os.environ.get("WEBHOOK_QUEUE_SIZE", "1000")))
+# Telegram-side cap on simultaneous HTTPS connections to us (1-100)
+WEBHOOK_MAX_CONNECTIONS = max(1, min(100, int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40"))))
+# Optional TLS termination in uvicorn; usually a reverse proxy handles this instead
+WEBHOOK_SSL_CERT = os.environ.get("WEBHOOK_SSL_CERT") or None
+WEBHOOK_SSL_KEY = os.environ.get("WEBHOOK_SSL_KEY") or None
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Characters Telegram allows in secret_token
+_SECRET_RE = re.compile(r"^[A-Za-z0-9_-]{1,256}$")
+
+
+def create_webhook_app(application, secret_token: str, path: str = WEBHOOK_PATH,
+                       webhook_url: Optional[str] = None) -> FastAPI:
+    """Return a FastAPI app that feeds validated updates into `application`.
+
+    The application should be built with a bounded update queue and no updater
+    (build_application(token, update_queue_size=...)). When `webhook_url` is given,
+    setWebhook is called on startup with the secret token.
+    """
+    if not _SECRET_RE.match(secret_token):
+        raise ValueError("secret_token must be 1-256 characters of A-Z, a-z, 0-9, '_' or '-'")
+    expected = secret_token.encode("utf-8")
+    queue: asyncio.Queue = application.update_queue
+    # With KrisBot's update processor the application starts a task for every queued
+    # update right away, so the queue on its own would never fill up; admission is
+    # tracked by the processor instead. A sequential processor (the supervisor's front
+    # application) awaits each update, so there the bounded queue pushes back by itself.
+    processor = application.update_processor
+    admits = hasattr(processor, "admit")
+
+    app = FastAPI(title="KrisBot Webhook")
+
+    @app.on_event("startup")
+    async def _start_application() -> None:
+        # run_polling/run_webhook normally drive these; here uvicorn owns the loop
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip("/") + path,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+            logger.info("Webhook registered at %s%s", webhook_url.rstrip("/"), path)
+        await application.start()
+
+    @app.on_event("shutdown")
+    async def _stop_application() -> None:
+        # The webhook is left registered so Telegram holds updates across restarts
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+    @app.post(path)
+    async def telegram_webhook(request: Request) -> Response:
+        token = request.headers.get(SECRET_HEADER, "").encode("utf-8")
+        if not hmac.compare_digest(token, expected):
+            return Response(status_code=403)
+        try:
+            data = await request.json()
+            # Valid JSON that is not an object ([], 1, "x") would fail inside de_json
+            if not isinstance(data, dict):
+                return Response(status_code=400)
+            update = Update.de_json(data, application.bot)
+        except (ValueError, TypeError, KeyError):
+            return Response(status_code=400)
+        if update is None:
+            return Response(status_code=400)
+
+        if not admits or processor.admit(update):
+            try:
+                queue.put_nowait(update)
+                return Response(status_code=200)
+            except asyncio.QueueFull:
+                if admits:
+                    processor.release(update)
+        logger.warning("Update backlog full (%d pending); asking Telegram to redeliver update %s",
+                       processor.admitted if admits else queue.qsize(), update.update_id)
+        return Response(status_code=503, headers={"Retry-After": "1"})
+
+    @app.get("/healthz")
+    async def healthz() -> Dict[str, Any]:
+        if admits:
+            return {"running": application.running, "queued": queue.qsize(), "pending": processor.admitted,
+                    "capacity": processor.max_pending}
+        return {"running": application.running, "queued": queue.qsize(), "pending": queue.qsize(),
+                "capacity": queue.maxsize}
+
+    return app
+
+
+def run_webhook(application) -> None:
+    """Serve `application` in webhook mode with uvicorn until interrupted."""
+    import uvicorn
+
+    if not WEBHOOK_URL.startswith("https://"):
+        raise ValueError("WEBHOOK_URL must be set to the public https:// URL Telegram should post to")
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    app = create_webhook_app(application, secret, webhook_url=WEBHOOK_URL)
+    uvicorn.run(
+        app,
+        host=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        ssl_certfile=WEBHOOK_SSL_CERT,
+        ssl_keyfile=WEBHOOK_SSL_KEY,
+        log_level="info",
+    )